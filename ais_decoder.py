@@ -0,0 +1,637 @@
+#!/usr/bin/env python3
+"""
+AIS Payload Decoder
+-------------------
+Decodes the 6-bit armored payload of !AIVDM/!AIVDO sentences for the common
+message types: position reports (1, 2, 3), base station reports (4), static
+and voyage data (5), class B position reports (18, 19), aids to navigation
+(21), static data reports (24) and long range broadcasts (27).
+
+The payload is de-armored into a single integer with a translation table and
+base64 decoding, so unpacking runs in C. Fields are extracted with shifts
+and masks only when read, so callers pay only for the fields they use.
+
+Scaled fields are returned in natural units (degrees, knots); "not
+available" values defined by ITU-R M.1371 (longitude 181, latitude 91,
+speed 102.3, course 360, heading 511) are passed through unchanged.
+
+For bulk processing, decode_positions() decodes the position fields of
+many payloads at once with NumPy (optional; only needed for batch decoding).
+
+Usage:
+    message = decode_sentence(b"!AIVDM,1,1,,B,15M67FC000G?ufbE`FepT@3n00Sa,0*5C")
+    if message and message.msg_type in (1, 2, 3):
+        print(message.mmsi, message.lat, message.lon)
+    
+    python3 ais_decoder.py capture.nmea > positions.csv
+"""
+
+import binascii
+import sys
+from typing import Dict, List, Optional, Sequence, Tuple, Type, Union
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Payload characters in order of their 6-bit value
+ARMOR_CHARS = bytes(range(48, 88)) + bytes(range(96, 120))
+BASE64_CHARS = b"ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/"
+# Maps payload characters to the base64 character with the same 6-bit value
+ARMOR_TO_BASE64 = bytes.maketrans(ARMOR_CHARS, BASE64_CHARS)
+# Maps payload characters to their 6-bit value, and other bytes to 64
+SIXBIT_VALUES = bytes(ARMOR_CHARS.index(byte) if byte in ARMOR_CHARS else 64 for byte in range(256))
+# Maps 6-bit values to AIS text characters
+SIXBIT_TEXT = "@ABCDEFGHIJKLMNOPQRSTUVWXYZ[\\]^_ !\"#$%&'()*+,-./0123456789:;<=>?"
+# Payload characters decoded per message by decode_positions()
+POSITION_CHARS = 28
+
+FieldValue = Union[int, float, bool, str, None]
+
+
+def unarmor(payload: bytes, fill: int = 0) -> Tuple[int, int]:
+    """
+    Convert an armored payload into a single integer.
+    
+    Args:
+        payload: 6-bit armored payload characters
+        fill: Number of fill bits at the end of the payload
+    
+    Returns:
+        Tuple of the payload bits as an integer (first bit most significant)
+        and the number of bits
+    
+    Raises:
+        ValueError: If the payload contains characters outside the armoring alphabet
+    """
+    if payload.translate(None, ARMOR_CHARS):
+        raise ValueError(f"Invalid payload characters in {payload!r}")
+    
+    # base64 decodes 4 characters into 3 bytes; pad with zero-valued characters
+    pad = -len(payload) % 4
+    data = binascii.a2b_base64(payload.translate(ARMOR_TO_BASE64) + b"A" * pad)
+    return int.from_bytes(data, "big") >> (pad * 6 + fill), len(payload) * 6 - fill
+
+
+class AISMessage:
+    """
+    A decoded AIS message.
+    
+    Holds the payload as one integer; fields defined on subclasses are
+    extracted when accessed. Fields beyond the end of a truncated payload
+    read as None.
+    """
+    
+    __slots__ = ("bits", "length")
+    
+    def __init__(self, bits: int, length: int):
+        self.bits = bits
+        self.length = length
+    
+    def uint(self, start: int, width: int) -> Optional[int]:
+        """
+        Extract an unsigned field.
+        
+        Args:
+            start: Offset of the field's first bit
+            width: Number of bits
+        
+        Returns:
+            The field value, or None if the payload is too short
+        """
+        shift = self.length - start - width
+        if shift < 0:
+            return None
+        return (self.bits >> shift) & ((1 << width) - 1)
+    
+    def sint(self, start: int, width: int) -> Optional[int]:
+        """Extract a two's complement signed field, None if the payload is too short."""
+        value = self.uint(start, width)
+        if value is not None and value >> (width - 1):
+            value -= 1 << width
+        return value
+    
+    def text(self, start: int, width: int) -> Optional[str]:
+        """Extract a 6-bit text field without its @ padding and trailing spaces."""
+        value = self.uint(start, width)
+        if value is None:
+            return None
+        chars = [SIXBIT_TEXT[(value >> shift) & 0x3F] for shift in range(width - 6, -1, -6)]
+        return "".join(chars).split("@", 1)[0].rstrip()
+    
+    @property
+    def msg_type(self) -> int:
+        """Message type (1-27)."""
+        return self.bits >> (self.length - 6)
+    
+    @property
+    def repeat(self) -> Optional[int]:
+        """Repeat indicator."""
+        return self.uint(6, 2)
+    
+    @property
+    def mmsi(self) -> Optional[int]:
+        """MMSI of the transmitting station."""
+        return self.uint(8, 30)
+    
+    def fields(self) -> Dict[str, FieldValue]:
+        """Decode every field of the message into a dict."""
+        names = ["msg_type", "repeat", "mmsi"]
+        for cls in reversed(type(self).__mro__[:-2]):
+            names.extend(name for name, value in vars(cls).items() if isinstance(value, (Field, property)))
+        return {name: getattr(self, name) for name in names}
+    
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}(msg_type={self.msg_type}, mmsi={self.mmsi})"
+
+
+class Field:
+    """
+    Descriptor for a fixed-position message field, decoded on access.
+    
+    Args:
+        start: Offset of the field's first bit
+        width: Number of bits
+        kind: "uint", "int", "bool" or "text"
+        scale: Divisor applied to numeric values
+    """
+    
+    def __init__(self, start: int, width: int, kind: str = "uint", scale: Optional[float] = None):
+        self.start = start
+        self.width = width
+        self.kind = kind
+        self.scale = scale
+    
+    def __get__(self, message: Optional[AISMessage], owner: Type[AISMessage]) -> FieldValue:
+        if message is None:
+            return self
+        if self.kind == "text":
+            return message.text(self.start, self.width)
+        if self.kind == "int":
+            value = message.sint(self.start, self.width)
+        else:
+            value = message.uint(self.start, self.width)
+        if value is None:
+            return None
+        if self.kind == "bool":
+            return bool(value)
+        if self.scale:
+            return round(value / self.scale, 6)
+        return value
+
+
+class PositionReport(AISMessage):
+    """Class A position report (types 1, 2 and 3)."""
+    
+    __slots__ = ()
+    status = Field(38, 4)
+    turn = Field(42, 8, "int")
+    speed = Field(50, 10, scale=10)
+    accuracy = Field(60, 1, "bool")
+    lon = Field(61, 28, "int", 600000)
+    lat = Field(89, 27, "int", 600000)
+    course = Field(116, 12, scale=10)
+    heading = Field(128, 9)
+    second = Field(137, 6)
+    maneuver = Field(143, 2)
+    raim = Field(148, 1, "bool")
+    radio = Field(149, 19)
+
+
+class BaseStationReport(AISMessage):
+    """Base station report (type 4)."""
+    
+    __slots__ = ()
+    year = Field(38, 14)
+    month = Field(52, 4)
+    day = Field(56, 5)
+    hour = Field(61, 5)
+    minute = Field(66, 6)
+    second = Field(72, 6)
+    accuracy = Field(78, 1, "bool")
+    lon = Field(79, 28, "int", 600000)
+    lat = Field(107, 27, "int", 600000)
+    epfd = Field(134, 4)
+    raim = Field(148, 1, "bool")
+    radio = Field(149, 19)
+
+
+class StaticVoyageData(AISMessage):
+    """Class A static and voyage related data (type 5)."""
+    
+    __slots__ = ()
+    ais_version = Field(38, 2)
+    imo = Field(40, 30)
+    callsign = Field(70, 42, "text")
+    shipname = Field(112, 120, "text")
+    shiptype = Field(232, 8)
+    to_bow = Field(240, 9)
+    to_stern = Field(249, 9)
+    to_port = Field(258, 6)
+    to_starboard = Field(264, 6)
+    epfd = Field(270, 4)
+    month = Field(274, 4)
+    day = Field(278, 5)
+    hour = Field(283, 5)
+    minute = Field(288, 6)
+    draught = Field(294, 8, scale=10)
+    destination = Field(302, 120, "text")
+    dte = Field(422, 1, "bool")
+
+
+class ClassBPositionReport(AISMessage):
+    """Standard class B position report (type 18)."""
+    
+    __slots__ = ()
+    speed = Field(46, 10, scale=10)
+    accuracy = Field(56, 1, "bool")
+    lon = Field(57, 28, "int", 600000)
+    lat = Field(85, 27, "int", 600000)
+    course = Field(112, 12, scale=10)
+    heading = Field(124, 9)
+    second = Field(133, 6)
+    cs = Field(141, 1, "bool")
+    display = Field(142, 1, "bool")
+    dsc = Field(143, 1, "bool")
+    band = Field(144, 1, "bool")
+    msg22 = Field(145, 1, "bool")
+    assigned = Field(146, 1, "bool")
+    raim = Field(147, 1, "bool")
+    radio = Field(148, 20)
+
+
+class ExtendedClassBReport(AISMessage):
+    """Extended class B position report (type 19)."""
+    
+    __slots__ = ()
+    speed = Field(46, 10, scale=10)
+    accuracy = Field(56, 1, "bool")
+    lon = Field(57, 28, "int", 600000)
+    lat = Field(85, 27, "int", 600000)
+    course = Field(112, 12, scale=10)
+    heading = Field(124, 9)
+    second = Field(133, 6)
+    shipname = Field(143, 120, "text")
+    shiptype = Field(263, 8)
+    to_bow = Field(271, 9)
+    to_stern = Field(280, 9)
+    to_port = Field(289, 6)
+    to_starboard = Field(295, 6)
+    epfd = Field(301, 4)
+    raim = Field(305, 1, "bool")
+    dte = Field(306, 1, "bool")
+    assigned = Field(307, 1, "bool")
+
+
+class AidToNavigationReport(AISMessage):
+    """Aid to navigation report (type 21)."""
+    
+    __slots__ = ()
+    aid_type = Field(38, 5)
+    accuracy = Field(163, 1, "bool")
+    lon = Field(164, 28, "int", 600000)
+    lat = Field(192, 27, "int", 600000)
+    to_bow = Field(219, 9)
+    to_stern = Field(228, 9)
+    to_port = Field(237, 6)
+    to_starboard = Field(243, 6)
+    epfd = Field(249, 4)
+    second = Field(253, 6)
+    off_position = Field(259, 1, "bool")
+    raim = Field(268, 1, "bool")
+    virtual_aid = Field(269, 1, "bool")
+    assigned = Field(270, 1, "bool")
+    
+    @property
+    def name(self) -> Optional[str]:
+        """Name, including the variable-length extension after bit 272."""
+        name = self.text(43, 120)
+        extension = (self.length - 272) // 6 * 6
+        if name is not None and extension > 0:
+            name += self.text(272, extension)
+        return name
+
+
+class StaticDataReport(AISMessage):
+    """
+    Class B static data report (type 24).
+    
+    Part A (partno 0) carries the name; part B (partno 1) the remaining
+    static data. Fields of the other part read as None.
+    """
+    
+    __slots__ = ()
+    partno = Field(38, 2)
+    
+    def _part(self, partno: int, start: int, width: int, kind: str = "uint") -> FieldValue:
+        """Extract a field that only exists in one part."""
+        if self.partno != partno:
+            return None
+        if kind == "text":
+            return self.text(start, width)
+        return self.uint(start, width)
+    
+    @property
+    def shipname(self) -> Optional[str]:
+        """Vessel name (part A)."""
+        return self._part(0, 40, 120, "text")
+    
+    @property
+    def shiptype(self) -> Optional[int]:
+        """Ship and cargo type (part B)."""
+        return self._part(1, 40, 8)
+    
+    @property
+    def vendorid(self) -> Optional[str]:
+        """Manufacturer id (part B)."""
+        return self._part(1, 48, 18, "text")
+    
+    @property
+    def callsign(self) -> Optional[str]:
+        """Call sign (part B)."""
+        return self._part(1, 90, 42, "text")
+    
+    @property
+    def to_bow(self) -> Optional[int]:
+        """Dimension to bow in metres (part B)."""
+        return self._part(1, 132, 9)
+    
+    @property
+    def to_stern(self) -> Optional[int]:
+        """Dimension to stern in metres (part B)."""
+        return self._part(1, 141, 9)
+    
+    @property
+    def to_port(self) -> Optional[int]:
+        """Dimension to port in metres (part B)."""
+        return self._part(1, 150, 6)
+    
+    @property
+    def to_starboard(self) -> Optional[int]:
+        """Dimension to starboard in metres (part B)."""
+        return self._part(1, 156, 6)
+
+
+class LongRangeReport(AISMessage):
+    """Long range AIS broadcast (type 27), with 1/10 minute positions."""
+    
+    __slots__ = ()
+    accuracy = Field(38, 1, "bool")
+    raim = Field(39, 1, "bool")
+    status = Field(40, 4)
+    lon = Field(44, 18, "int", 600)
+    lat = Field(62, 17, "int", 600)
+    speed = Field(79, 6)
+    course = Field(85, 9)
+    gnss = Field(94, 1, "bool")
+
+
+MESSAGE_CLASSES: Dict[int, Type[AISMessage]] = {
+    1: PositionReport,
+    2: PositionReport,
+    3: PositionReport,
+    4: BaseStationReport,
+    5: StaticVoyageData,
+    18: ClassBPositionReport,
+    19: ExtendedClassBReport,
+    21: AidToNavigationReport,
+    24: StaticDataReport,
+    27: LongRangeReport,
+}
+
+
+def decode(payload: bytes, fill: int = 0) -> Optional[AISMessage]:
+    """
+    Decode an armored payload.
+    
+    Args:
+        payload: 6-bit armored payload, fragments already joined
+        fill: Number of fill bits at the end of the payload
+    
+    Returns:
+        The message as the class for its type (AISMessage for types without
+        one), or None if the payload is empty or not valid armoring
+    """
+    try:
+        bits, length = unarmor(payload, fill)
+    except (ValueError, binascii.Error):
+        return None
+    if length < 38:
+        return None
+    return MESSAGE_CLASSES.get(bits >> (length - 6), AISMessage)(bits, length)
+
+
+def sentence_payload(data: bytes) -> Optional[Tuple[bytes, int]]:
+    """
+    Extract the payload and fill bits from one or more sentences.
+    
+    Args:
+        data: A !AIVDM/!AIVDO sentence, or the CR LF separated fragments of
+            a multi-part message, each optionally starting with a TAG block
+    
+    Returns:
+        Tuple of the joined payload and the fill bits of the last fragment,
+        or None if data is not an AIS sentence
+    """
+    payloads: List[bytes] = []
+    fill = 0
+    for line in data.splitlines():
+        start = line.find(b"\\", 1) + 1 if line.startswith(b"\\") else 0
+        if line[start + 3:start + 6] not in (b"VDM", b"VDO"):
+            return None
+        fields = line[start:].split(b",", 7)
+        if len(fields) < 7:
+            return None
+        payloads.append(fields[5])
+        fill = fields[6][0] - 0x30 if fields[6] else 0
+        if not 0 <= fill <= 5:
+            return None
+    if not payloads:
+        return None
+    return b"".join(payloads), fill
+
+
+def peek_header(line: bytes) -> Optional[Tuple[int, int]]:
+    """
+    Read the message type and MMSI of a sentence without decoding it.
+    
+    Only the first seven payload characters are looked at. For multi-part
+    messages only the first fragment carries the header.
+    
+    Args:
+        line: Sentence, optionally starting with a TAG block; for a
+            reassembled group, the first line is used
+    
+    Returns:
+        Tuple of message type and MMSI, or None if line is not an AIS
+        sentence, not a first fragment or too short
+    """
+    start = line.find(b"\\", 1) + 1 if line.startswith(b"\\") else 0
+    if line[start + 3:start + 6] not in (b"VDM", b"VDO"):
+        return None
+    fields = line[start:].split(b",", 6)
+    if len(fields) < 7 or fields[2] != b"1" or len(fields[5]) < 7:
+        return None
+    
+    values = fields[5][:7].translate(SIXBIT_VALUES)
+    if max(values) > 63:
+        return None
+    # Type is bits 0-5, MMSI bits 8-37
+    mmsi = ((values[1] & 0x0F) << 26 | values[2] << 20 | values[3] << 14
+            | values[4] << 8 | values[5] << 2 | values[6] >> 4)
+    return values[0], mmsi
+
+
+def decode_sentence(data: bytes) -> Optional[AISMessage]:
+    """
+    Decode a sentence or a reassembled multi-part message.
+    
+    Args:
+        data: Line(s) as forwarded, see sentence_payload()
+    
+    Returns:
+        The decoded message, or None if data is not a decodable AIS sentence
+    """
+    payload = sentence_payload(data)
+    if payload is None:
+        return None
+    return decode(*payload)
+
+
+# Position report layouts for decode_positions(): message types, bits needed,
+# and (field, start, width, signed, scale) for each field
+POSITION_LAYOUTS = [
+    ((1, 2, 3), 143, [
+        ("speed", 50, 10, False, 10),
+        ("lon", 61, 28, True, 600000),
+        ("lat", 89, 27, True, 600000),
+        ("course", 116, 12, False, 10),
+        ("heading", 128, 9, False, 1),
+        ("second", 137, 6, False, 1),
+    ]),
+    ((18, 19), 139, [
+        ("speed", 46, 10, False, 10),
+        ("lon", 57, 28, True, 600000),
+        ("lat", 85, 27, True, 600000),
+        ("course", 112, 12, False, 10),
+        ("heading", 124, 9, False, 1),
+        ("second", 133, 6, False, 1),
+    ]),
+    ((27,), 94, [
+        ("lon", 44, 18, True, 600),
+        ("lat", 62, 17, True, 600),
+        ("speed", 79, 6, False, 1),
+        ("course", 85, 9, False, 1),
+    ]),
+]
+
+POSITION_DTYPE = [
+    ("msg_type", "u1"),
+    ("mmsi", "u4"),
+    ("lat", "f8"),
+    ("lon", "f8"),
+    ("speed", "f8"),
+    ("course", "f8"),
+    ("heading", "u2"),
+    ("second", "u1"),
+    ("valid", "?"),
+]
+
+
+def _bit_field(symbols: "np.ndarray", start: int, width: int, signed: bool = False) -> "np.ndarray":
+    """Extract a field from a 2-D array of 6-bit symbols, one message per row."""
+    first = start // 6
+    last = (start + width - 1) // 6
+    values = np.zeros(len(symbols), dtype=np.int64)
+    for column in range(first, last + 1):
+        values = (values << 6) | symbols[:, column]
+    values = (values >> ((last + 1) * 6 - start - width)) & ((1 << width) - 1)
+    if signed:
+        values = np.where(values >> (width - 1), values - (1 << width), values)
+    return values
+
+
+def decode_positions(payloads: Sequence[bytes]) -> "np.ndarray":
+    """
+    Decode the position fields of many payloads at once.
+    
+    Payloads are converted to a 2-D array of 6-bit symbols and each field is
+    extracted column-wise for every message with NumPy bit operations.
+    Position reports (types 1, 2, 3, 18, 19 and 27) get msg_type, mmsi, lat,
+    lon, speed, course, heading and second with valid set; other types only
+    get msg_type and mmsi. Fields a message type does not carry are NaN, or
+    511 (heading) and 60 (second) as in the messages themselves.
+    
+    Args:
+        payloads: Armored payloads of single-sentence messages
+    
+    Returns:
+        Structured array with POSITION_DTYPE, one row per payload
+    
+    Raises:
+        ImportError: If NumPy is not installed
+    """
+    if np is None:
+        raise ImportError("NumPy is required for decode_positions()")
+    
+    count = len(payloads)
+    result = np.zeros(count, dtype=POSITION_DTYPE)
+    for name in ("lat", "lon", "speed", "course"):
+        result[name] = np.nan
+    result["heading"] = 511
+    result["second"] = 60
+    if not count:
+        return result
+    
+    lengths = np.fromiter((len(payload) for payload in payloads), dtype=np.int64, count=count)
+    buffer = b"".join(payload[:POSITION_CHARS].ljust(POSITION_CHARS, b"0") for payload in payloads)
+    chars = np.frombuffer(buffer, dtype=np.uint8).reshape(count, POSITION_CHARS)
+    
+    # De-armor: subtract 48, and 8 more for characters above "W"
+    symbols = chars - 48
+    symbols -= (symbols > 40) * np.uint8(8)
+    armored = ((chars >= 48) & (chars < 88)) | ((chars >= 96) & (chars < 120))
+    symbols = symbols.astype(np.int64)
+    
+    ok = armored.all(axis=1) & (lengths >= 7)
+    msg_type = _bit_field(symbols, 0, 6)
+    result["msg_type"] = np.where(ok, msg_type, 0)
+    result["mmsi"] = np.where(ok, _bit_field(symbols, 8, 30), 0)
+    
+    for types, needed, layout in POSITION_LAYOUTS:
+        rows = ok & np.isin(msg_type, types) & (lengths * 6 >= needed)
+        if not rows.any():
+            continue
+        selected = symbols[rows]
+        for name, start, width, signed, scale in layout:
+            values = _bit_field(selected, start, width, signed)
+            result[name][rows] = values / scale if scale != 1 else values
+        result["valid"][rows] = True
+    return result
+
+
+def main() -> None:
+    """Decode position reports from NMEA capture files to CSV on stdout."""
+    if len(sys.argv) < 2:
+        print("Usage: ais_decoder.py capture.nmea [...]", file=sys.stderr)
+        sys.exit(1)
+    
+    payloads = []
+    for path in sys.argv[1:]:
+        with open(path, "rb") as capture:
+            for line in capture:
+                payload = sentence_payload(line)
+                if payload:
+                    payloads.append(payload[0])
+    
+    positions = decode_positions(payloads)
+    positions = positions[positions["valid"]]
+    names = [name for name, _ in POSITION_DTYPE if name != "valid"]
+    print(",".join(names))
+    for row in positions.tolist():
+        print(",".join(str(value) for value in row[:-1]))
+
+
+if __name__ == "__main__":
+    main()
@@ -11,33 +11,159 @@ Usage:
 
 import serial
 import socket
+import asyncio
+import json
 import threading
 import configparser
 import time
 import logging
 import sys
 import signal
-import queue
-from typing import Dict, Optional, Union, List, Tuple
-from dataclasses import dataclass
+import ipaddress
+import selectors
+import functools
+import struct
+import math
+from collections import Counter, deque
+from typing import Callable, Dict, Iterator, NamedTuple, Optional, Union, List, Set, Tuple
+from dataclasses import dataclass, field, fields
 import os
 from logging.handlers import RotatingFileHandler
 
+from ais_decoder import decode_sentence, peek_header
+
 # Constants
 DEFAULT_CONFIG_PATH = "/home/JLBMaritime/ais-forwarder/config/ais_config.conf"
-MAX_QUEUE_SIZE = 1000
+QUEUE_MAX_BYTES = 1024 * 1024  # 1MB of sentences queued per output
+OVERFLOW_POLICIES = ("drop_oldest", "drop_newest")
+OVERFLOW_LOG_INTERVAL = 60  # seconds between reports of queue overflows
+COMPACT_MIN_GROWTH = 0.25  # share of the budget appended between compactions
+COMPACT_CHECKPOINT = 1000  # spool records compacted between resume points
+LIVE_WINDOW = 5.0  # seconds after receipt a queued sentence still counts as live
+BACKLOG_SHARE = 0.5  # largest share of sentences sent from the backlog while live data waits
 SOCKET_TIMEOUT = 5  # seconds
 RECONNECT_DELAY = 5  # seconds
 BACKOFF_FACTOR = 1.5  # for exponential backoff
 MAX_BACKOFF_DELAY = 60  # maximum seconds to wait between retries
+BATCH_MAX_COUNT = 64  # sentences per vectored write
+BATCH_MAX_BYTES = 8192  # bytes per vectored write
+BATCH_MAX_LATENCY = 0.05  # seconds to wait for a batch to fill
+IOV_MAX = 1024  # upper bound on buffers passed to sendmsg()
+RETRY_DELAY = 1  # seconds between attempts to resend a failed batch
+SPOOL_MAX_BYTES = 100 * 1024 * 1024  # 100MB
+SPOOL_SEGMENT_BYTES = 1024 * 1024  # 1MB
+SPOOL_FSYNC_INTERVAL = 1.0  # seconds
+UDP_MTU = 1500  # bytes, including IP and UDP headers
+IP_UDP_OVERHEAD = 28  # IPv4 header + UDP header bytes
+PROTOCOLS = ("tcp", "udp", "tcp_server")
+CLIENT_BUFFER_BYTES = 256 * 1024  # unsent bytes a server output client may fall behind by
+ENGINES = ("threaded", "asyncio")
+INPUT_TYPES = ("serial", "tcp_client", "tcp_server", "udp")
+RECV_SIZE = 65536  # bytes per network read
+MAX_LINE_LENGTH = 4096  # bytes buffered without a line ending before discarding
+INVALID_ACTIONS = ("drop", "quarantine")
+INVALID_LOG_INTERVAL = 60  # seconds between reports of checksum failures
+FRAGMENT_TIMEOUT = 2.0  # seconds to wait for the rest of a multi-part message
+MAX_FRAGMENT_GROUPS = 64  # incomplete multi-part messages held per stream
+MAX_FRAGMENT_SENDERS = 64  # UDP senders with incomplete multi-part messages held per input
+GEOFENCE_CELL = 0.01  # degrees per geofence grid cell (about 1km)
+GEOFENCE_MAX_CELLS = 4 * 1024 * 1024
+VESSEL_TTL = 600  # seconds a vessel stays in the cache after its last message
+VESSEL_CACHE_SIZE = 50000  # vessels held in the cache
+VESSEL_WHEEL_SLOTS = 60  # timing wheel buckets spanning vessel_ttl
+POSITION_TYPES = frozenset((1, 2, 3, 4, 9, 18, 19, 21, 27))
+SNAPSHOT_RATE = 500  # cached sentences per second sent to a newly connected output
+SNAPSHOT_INTERVAL = 0.1  # seconds between snapshot chunks
+DOWNSAMPLE_TYPES = frozenset((1, 2, 3, 18, 19, 27))  # vessel position reports
+DOWNSAMPLE_MIN_INTERVAL = 10.0  # seconds between reports of fast or turning vessels
+DOWNSAMPLE_MAX_INTERVAL = 180.0  # seconds between reports of stationary vessels
+DOWNSAMPLE_FAST_SPEED = 23.0  # knots at and above which min_interval applies
+DOWNSAMPLE_SLOW_SPEED = 1.0  # knots below which a vessel counts as stationary
+DOWNSAMPLE_TURN = 15  # ROT indicator (about 10 degrees per minute) that counts as turning
 
-# Define a dataclass for holding configuration details
+# Define dataclasses for holding configuration details
 @dataclass
-class AISConfig:
-    """Configuration data for AIS connection."""
-    serial_port: str
+class InputConfig:
+    """
+    Configuration data for one input.
+    
+    Serial inputs use serial_port. Network inputs use host and port: the
+    server to connect to for tcp_client, or the address to listen on for
+    tcp_server and udp.
+    """
+    name: str
+    serial_port: str = ""
+    type: str = "serial"
+    host: str = ""
+    port: int = 0
+    baudrate: int = 38400
+    serial_timeout: float = 2.0
+    tag_source: bool = False
+    source: str = ""  # TAG block s: value, defaults to the input name
+    validate_checksum: bool = False
+    invalid_action: str = "drop"  # drop or quarantine lines failing validation
+    quarantine_file: str = ""
+    reassemble: bool = False
+    fragment_timeout: float = FRAGMENT_TIMEOUT
+
+
+@dataclass
+class OutputConfig:
+    """Configuration data for one forwarding destination."""
+    name: str
     ip: str
     port: int
+    protocol: str = "tcp"
+    max_retries: int = 3
+    queue_max_bytes: int = QUEUE_MAX_BYTES
+    overflow_policy: str = "drop_oldest"
+    batch_enabled: bool = False
+    batch_max_count: int = BATCH_MAX_COUNT
+    batch_max_bytes: int = BATCH_MAX_BYTES
+    batch_max_latency: float = BATCH_MAX_LATENCY
+    spool_dir: Optional[str] = None
+    spool_max_bytes: int = SPOOL_MAX_BYTES
+    spool_segment_bytes: int = SPOOL_SEGMENT_BYTES
+    spool_fsync_interval: float = SPOOL_FSYNC_INTERVAL
+    mtu: int = UDP_MTU
+    multicast_ttl: int = 1
+    broadcast: bool = False
+    tag_timestamp: bool = False
+    client_buffer: int = CLIENT_BUFFER_BYTES
+    # Message types and MMSIs: comma-separated, or the path of a file with one per line
+    allow_types: str = ""
+    deny_types: str = ""
+    allow_mmsi: str = ""
+    deny_mmsi: str = ""
+    # Polygons as "lat lon, lat lon, ..." separated by ";", or the path of a file with one per line
+    geofence: str = ""
+    geofence_cell: float = GEOFENCE_CELL
+    snapshot_on_connect: bool = False
+    snapshot_rate: int = SNAPSHOT_RATE
+    # Seconds after receipt a queued sentence is discarded instead of sent (0 keeps everything)
+    max_age: float = 0
+    compact: bool = False
+    downsample: bool = False
+    downsample_min_interval: float = DOWNSAMPLE_MIN_INTERVAL
+    downsample_max_interval: float = DOWNSAMPLE_MAX_INTERVAL
+    live_first: bool = False
+    live_window: float = LIVE_WINDOW
+    backlog_share: float = BACKLOG_SHARE
+    backlog_rate: int = 0
+
+
+@dataclass
+class AISConfig:
+    """
+    Configuration data for AIS connection.
+    
+    The serial_port and ip/port settings in the AIS section describe the
+    default input and output, and the other input and output settings there
+    provide defaults for any [input:<name>] and [output:<name>] sections.
+    """
+    serial_port: Optional[str] = None
+    ip: Optional[str] = None
+    port: Optional[int] = None
     baudrate: int = 38400
     serial_timeout: float = 2.0
     max_retries: int = 3
@@ -45,6 +171,30 @@ class AISConfig:
     log_file: Optional[str] = None
     log_max_size: int = 10 * 1024 * 1024  # 10MB
     log_backup_count: int = 5
+    engine: str = "threaded"
+    admin_host: str = "127.0.0.1"
+    admin_port: int = 0
+    vessel_cache: bool = False
+    vessel_ttl: float = VESSEL_TTL
+    vessel_cache_size: int = VESSEL_CACHE_SIZE
+    inputs: List[InputConfig] = field(default_factory=list)
+    outputs: List[OutputConfig] = field(default_factory=list)
+    
+    def __post_init__(self):
+        if not self.inputs and self.serial_port:
+            self.inputs.append(InputConfig(
+                name="default",
+                serial_port=self.serial_port,
+                baudrate=self.baudrate,
+                serial_timeout=self.serial_timeout
+            ))
+        if not self.outputs and self.ip:
+            self.outputs.append(OutputConfig(
+                name="default",
+                ip=self.ip,
+                port=self.port,
+                max_retries=self.max_retries
+            ))
 
 
 # Configure logging
@@ -113,252 +263,3887 @@ def load_config(file_path: str) -> AISConfig:
         if not config.has_section("AIS"):
             raise ValueError("Missing 'AIS' section in config file")
         
-        required_fields = ["serial_port", "ip", "port"]
-        for field in required_fields:
-            if not config.has_option("AIS", field):
-                raise ValueError(f"Missing required field '{field}' in AIS section")
+        required_fields = []
+        if config.has_option("AIS", "ip") or config.has_option("AIS", "port"):
+            required_fields += ["ip", "port"]
+        for field_name in required_fields:
+            if not config.has_option("AIS", field_name):
+                raise ValueError(f"Missing required field '{field_name}' in AIS section")
+        
+        inputs = []
+        if config.has_option("AIS", "serial_port"):
+            inputs.append(load_input(config, "AIS", "default"))
+        for section in config.sections():
+            if section.startswith("input:"):
+                inputs.append(load_input(config, section, section[len("input:"):].strip()))
+        
+        outputs = []
+        if config.has_option("AIS", "ip"):
+            outputs.append(load_output(config, "AIS", "default"))
+        for section in config.sections():
+            if section.startswith("output:"):
+                outputs.append(load_output(config, section, section[len("output:"):].strip()))
         
         # Create AISConfig with defaults
         ais_config = AISConfig(
-            serial_port=config["AIS"]["serial_port"],
-            ip=config["AIS"]["ip"],
-            port=int(config["AIS"]["port"]),
+            serial_port=config.get("AIS", "serial_port", fallback=None),
+            ip=config.get("AIS", "ip", fallback=None),
+            port=config.getint("AIS", "port", fallback=None),
             baudrate=config.getint("AIS", "baudrate", fallback=38400),
             serial_timeout=config.getfloat("AIS", "serial_timeout", fallback=2.0),
             max_retries=config.getint("AIS", "max_retries", fallback=3),
             log_level=config.get("AIS", "log_level", fallback="INFO"),
             log_file=config.get("AIS", "log_file", fallback=None),
             log_max_size=config.getint("AIS", "log_max_size", fallback=10 * 1024 * 1024),
-            log_backup_count=config.getint("AIS", "log_backup_count", fallback=5)
+            log_backup_count=config.getint("AIS", "log_backup_count", fallback=5),
+            engine=config.get("AIS", "engine", fallback="threaded"),
+            admin_host=config.get("AIS", "admin_host", fallback="127.0.0.1"),
+            admin_port=config.getint("AIS", "admin_port", fallback=0),
+            vessel_cache=config.getboolean("AIS", "vessel_cache", fallback=False),
+            vessel_ttl=config.getfloat("AIS", "vessel_ttl", fallback=VESSEL_TTL),
+            vessel_cache_size=config.getint("AIS", "vessel_cache_size", fallback=VESSEL_CACHE_SIZE),
+            inputs=inputs,
+            outputs=outputs
         )
         
+        if ais_config.engine not in ENGINES:
+            raise ValueError(f"engine must be one of {', '.join(ENGINES)}")
+        if ais_config.vessel_ttl <= 0 or ais_config.vessel_cache_size <= 0:
+            raise ValueError("vessel_ttl and vessel_cache_size must be positive")
+        
+        if not ais_config.inputs:
+            raise ValueError("No inputs configured: set serial_port in the AIS section or add [input:<name>] sections")
+        
+        names = [ais_input.name for ais_input in ais_config.inputs]
+        if len(set(names)) != len(names):
+            raise ValueError("Input names must be unique")
+        
+        for ais_input in ais_config.inputs:
+            if ais_input.type not in INPUT_TYPES:
+                raise ValueError(f"Input '{ais_input.name}': type must be one of {', '.join(INPUT_TYPES)}")
+            source = ais_input.source or ais_input.name
+            if any(char in source for char in ",*\\!$"):
+                raise ValueError(f"Input '{ais_input.name}': source must not contain , * \\ ! or $")
+            if ais_input.invalid_action not in INVALID_ACTIONS:
+                raise ValueError(f"Input '{ais_input.name}': invalid_action must be one of {', '.join(INVALID_ACTIONS)}")
+            if ais_input.invalid_action == "quarantine" and not ais_input.quarantine_file:
+                raise ValueError(f"Input '{ais_input.name}': quarantine_file is required to quarantine invalid lines")
+
+        if not ais_config.outputs:
+            raise ValueError("No outputs configured: set ip/port in the AIS section or add [output:<name>] sections")
+        
+        names = [output.name for output in ais_config.outputs]
+        if len(set(names)) != len(names):
+            raise ValueError("Output names must be unique")
+        
+        for output in ais_config.outputs:
+            if output.protocol not in PROTOCOLS:
+                raise ValueError(f"Output '{output.name}': protocol must be one of {', '.join(PROTOCOLS)}")
+            if output.queue_max_bytes <= 0:
+                raise ValueError(f"Output '{output.name}': queue_max_bytes must be positive")
+            if output.overflow_policy not in OVERFLOW_POLICIES:
+                raise ValueError(f"Output '{output.name}': overflow_policy must be one of {', '.join(OVERFLOW_POLICIES)}")
+            if not 0 < output.downsample_min_interval <= output.downsample_max_interval:
+                raise ValueError(f"Output '{output.name}': downsample_min_interval must be positive "
+                                 f"and no larger than downsample_max_interval")
+            if output.max_age < 0:
+                raise ValueError(f"Output '{output.name}': max_age must not be negative")
+            if output.live_window <= 0:
+                raise ValueError(f"Output '{output.name}': live_window must be positive")
+            if not 0 <= output.backlog_share <= 1:
+                raise ValueError(f"Output '{output.name}': backlog_share must be between 0 and 1")
+            if output.backlog_rate < 0:
+                raise ValueError(f"Output '{output.name}': backlog_rate must not be negative")
+            if output.client_buffer <= 0:
+                raise ValueError(f"Output '{output.name}': client_buffer must be positive")
+            if output.mtu <= IP_UDP_OVERHEAD:
+                raise ValueError(f"Output '{output.name}': mtu must be larger than {IP_UDP_OVERHEAD}")
+            if not 1 <= output.batch_max_count <= IOV_MAX:
+                raise ValueError(f"Output '{output.name}': batch_max_count must be between 1 and {IOV_MAX}")
+            if output.spool_segment_bytes >= output.spool_max_bytes:
+                raise ValueError(f"Output '{output.name}': spool_segment_bytes must be smaller than spool_max_bytes")
+            try:
+                for id_list in (output.allow_types, output.deny_types, output.allow_mmsi, output.deny_mmsi):
+                    load_id_list(id_list)
+                for polygon in load_polygons(output.geofence):
+                    Geofence.grid_shape(polygon, output.geofence_cell)
+            except (ValueError, OSError) as e:
+                raise ValueError(f"Output '{output.name}': invalid filter: {e}")
+            if output.snapshot_on_connect and not ais_config.vessel_cache:
+                raise ValueError(f"Output '{output.name}': snapshot_on_connect requires vessel_cache = true")
+            if output.snapshot_on_connect and output.protocol == "udp":
+                raise ValueError(f"Output '{output.name}': snapshot_on_connect needs a tcp or tcp_server output")
+            if not 1 <= output.snapshot_rate * SNAPSHOT_INTERVAL <= IOV_MAX:
+                raise ValueError(f"Output '{output.name}': snapshot_rate must be between "
+                                 f"{int(1 / SNAPSHOT_INTERVAL)} and {int(IOV_MAX / SNAPSHOT_INTERVAL)}")
+        
         return ais_config
     except Exception as e:
         logging.error(f"Error loading config file: {e}")
         sys.exit(1)
 
 
-class SocketManager:
-    """Manages TCP socket connections with connection pooling and reconnection logic."""
+def load_section(config: configparser.ConfigParser, section: str, name: str,
+                 cls: type, local_fields: Tuple[str, ...]) -> Dict[str, Union[str, int, float, bool]]:
+    """
+    Read the fields of a settings dataclass from a config section.
     
-    def __init__(self, host: str, port: int, max_retries: int = 3):
-        self.host = host
-        self.port = port
-        self.max_retries = max_retries
-        self.socket = None
-        self.socket_lock = threading.Lock()
-        self.connected = False
-        self.last_attempt = 0
-        self.backoff_delay = RECONNECT_DELAY
+    Fields missing from the section fall back to the AIS section, except
+    local_fields, which only apply to the section that sets them.
     
-    def connect(self) -> bool:
-        """
-        Establish connection to the socket.
+    Args:
+        config: Parsed configuration file
+        section: Section to read
+        name: Name to store in the dataclass's name field
+        cls: InputConfig or OutputConfig
+        local_fields: Fields that are never inherited from the AIS section
         
-        Returns:
-            bool: True if connection successful, False otherwise
-        """
-        with self.socket_lock:
-            if self.connected:
-                return True
-            
-            # Implement exponential backoff
-            current_time = time.time()
-            time_since_last_attempt = current_time - self.last_attempt
-            
-            if time_since_last_attempt < self.backoff_delay:
-                # Not enough time has passed since last attempt
-                return False
-            
-            self.last_attempt = current_time
-            
-            try:
-                if self.socket:
-                    self.socket.close()
-                
-                self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-                self.socket.settimeout(SOCKET_TIMEOUT)
-                self.socket.connect((self.host, self.port))
-                self.connected = True
-                # Reset backoff on successful connection
-                self.backoff_delay = RECONNECT_DELAY
-                logging.info(f"Connected to {self.host}:{self.port}")
-                return True
-            except socket.error as e:
-                logging.warning(f"Failed to connect to {self.host}:{self.port}: {e}")
-                # Increase backoff delay for next attempt (with max limit)
-                self.backoff_delay = min(self.backoff_delay * BACKOFF_FACTOR, MAX_BACKOFF_DELAY)
-                self.connected = False
-                return False
+    Returns:
+        Keyword arguments for cls
+    """
+    values = {"name": name}
+    for settings_field in fields(cls):
+        key = settings_field.name
+        if config.has_option(section, key):
+            source = section
+        elif key not in local_fields and config.has_option("AIS", key):
+            source = "AIS"
+        else:
+            continue
+        
+        # Unwrap Optional[...] to pick the matching ConfigParser getter
+        option_type = settings_field.type
+        option_type = next(
+            (arg for arg in getattr(option_type, "__args__", ()) if arg is not type(None)),
+            option_type
+        )
+        getter = {int: config.getint, float: config.getfloat, bool: config.getboolean}.get(option_type, config.get)
+        values[key] = getter(source, key)
+    return values
+
+
+def load_input(config: configparser.ConfigParser, section: str, name: str) -> InputConfig:
+    """
+    Load the settings of one input.
     
-    def send(self, data: bytes) -> bool:
-        """
-        Send data through the socket.
+    The default input is the serial port in the AIS section. An
+    [input:<name>] section falls back to the AIS section for every setting
+    except its type, address and source.
+    
+    Args:
+        config: Parsed configuration file
+        section: Section holding the input's serial_port or host/port
+        name: Name of the input
         
-        Args:
-            data: Bytes to send
-            
-        Returns:
-            bool: True if send successful, False otherwise
-        """
-        with self.socket_lock:
-            if not self.connected and not self.connect():
-                return False
-            
-            try:
-                self.socket.sendall(data)
-                return True
-            except socket.error as e:
-                logging.warning(f"Error sending data to {self.host}:{self.port}: {e}")
-                self.connected = False
-                return False
+    Returns:
+        InputConfig for the section
+        
+    Raises:
+        ValueError: If a required field is missing
+    """
+    if section == "AIS":
+        input_type = "serial"
+    else:
+        input_type = config.get(section, "type", fallback="serial")
+    required_fields = {
+        "serial": ["serial_port"],
+        "tcp_client": ["host", "port"],
+    }.get(input_type, ["port"])
+    for field_name in required_fields:
+        if not config.has_option(section, field_name):
+            raise ValueError(f"Missing required field '{field_name}' in {section} section")
     
-    def close(self) -> None:
-        """Close the socket connection."""
-        with self.socket_lock:
-            if self.socket:
-                try:
-                    self.socket.close()
-                except Exception as e:
-                    logging.warning(f"Error closing socket: {e}")
-                finally:
-                    self.connected = False
-                    self.socket = None
+    local_fields = ("name", "serial_port", "type", "host", "port", "source")
+    values = load_section(config, section, name, InputConfig, local_fields)
+    values["type"] = input_type
+    return InputConfig(**values)
 
 
-class AISHandler:
-    """Handles AIS data processing with producer-consumer pattern."""
+def load_output(config: configparser.ConfigParser, section: str, name: str) -> OutputConfig:
+    """
+    Load the settings of one output.
     
-    def __init__(self, config: AISConfig):
-        self.config = config
-        self.serial_port = None
-        self.data_queue = queue.Queue(maxsize=MAX_QUEUE_SIZE)
-        self.socket_manager = SocketManager(
-            config.ip, 
-            config.port, 
-            config.max_retries
-        )
-        self.running = False
-        self.producer_thread = None
-        self.consumer_thread = None
+    The default output is read from the AIS section. An [output:<name>]
+    section falls back to the AIS section for every setting except ip and
+    port, and a spool_dir inherited from the AIS section gets a per-output
+    subdirectory.
     
-    def _producer(self) -> None:
-        """Read data from serial port and add to queue."""
-        while self.running:
-            try:
-                if self.serial_port is None or not self.serial_port.is_open:
-                    self._connect_serial()
-                    if self.serial_port is None:
-                        time.sleep(RECONNECT_DELAY)
-                        continue
-                
-                line = self.serial_port.readline()
-                if line:
-                    logging.debug(f"Received AIS data: {line}")
-                    try:
-                        self.data_queue.put(line, block=True, timeout=1)
-                    except queue.Full:
-                        logging.warning("Queue full, dropping AIS data")
-            except serial.SerialException as e:
-                logging.error(f"AIS serial read error: {e}")
-                self._close_serial()
-                time.sleep(RECONNECT_DELAY)
-            except Exception as e:
-                logging.error(f"Unexpected error in producer: {e}")
-                time.sleep(1)
+    Args:
+        config: Parsed configuration file
+        section: Section holding the output's ip and port
+        name: Name of the output
+        
+    Returns:
+        OutputConfig for the section
+        
+    Raises:
+        ValueError: If a required field is missing
+    """
+    for field_name in ["ip", "port"]:
+        if not config.has_option(section, field_name):
+            raise ValueError(f"Missing required field '{field_name}' in {section} section")
     
-    def _consumer(self) -> None:
-        """Process data from queue and send to TCP endpoint."""
-        while self.running:
-            try:
-                # Get data with timeout to allow checking self.running periodically
-                try:
-                    data = self.data_queue.get(block=True, timeout=1)
-                except queue.Empty:
-                    continue
-                
-                sent = self.socket_manager.send(data)
-                if sent:
-                    logging.debug(f"Sent {len(data)} bytes to {self.config.ip}:{self.config.port}")
-                else:
-                    logging.warning("Failed to send data, re-queuing")
-                    try:
-                        # Try to put it back in the queue
-                        self.data_queue.put(data, block=False)
-                    except queue.Full:
-                        logging.warning("Queue full, dropping data on send failure")
-                
-                self.data_queue.task_done()
-            except Exception as e:
-                logging.error(f"Unexpected error in consumer: {e}")
-                time.sleep(1)
+    values = load_section(config, section, name, OutputConfig, ("name", "ip", "port"))
+    if section != "AIS" and values.get("spool_dir") and not config.has_option(section, "spool_dir"):
+        values["spool_dir"] = os.path.join(values["spool_dir"], name)
+    return OutputConfig(**values)
+
+
+def nmea_checksum(data: bytes) -> int:
+    """Return the NMEA checksum (XOR of all bytes) of data."""
+    checksum = 0
+    for byte in data:
+        checksum ^= byte
+    return checksum
+
+
+# Value of each byte as a hex digit, 16 for bytes that are not one
+HEX_VALUES = bytes(int(chr(byte), 16) if chr(byte) in "0123456789abcdefABCDEF" else 16 for byte in range(256))
+
+
+def nmea_checksum_valid(line: bytes) -> bool:
+    """
+    Check the *hh checksum of a sentence.
     
-    def _connect_serial(self) -> None:
-        """Connect to the serial port."""
-        try:
-            self.serial_port = serial.Serial(
-                self.config.serial_port,
-                baudrate=self.config.baudrate,
-                timeout=self.config.serial_timeout
-            )
-            logging.info(f"Connected to AIS serial port: {self.config.serial_port}")
-        except serial.SerialException as e:
-            logging.error(f"Failed to connect to serial port {self.config.serial_port}: {e}")
-            self.serial_port = None
+    Works on the raw bytes; a leading TAG block and the line ending are
+    skipped. Sentences without a checksum are invalid.
     
-    def _close_serial(self) -> None:
-        """Close the serial port connection."""
-        if self.serial_port and self.serial_port.is_open:
-            try:
-                self.serial_port.close()
-            except Exception as e:
-                logging.warning(f"Error closing serial port: {e}")
-            finally:
-                self.serial_port = None
+    Args:
+        line: Sentence as received, optionally starting with a TAG block
+        
+    Returns:
+        bool: True if the sentence's checksum matches its contents
+    """
+    start = 0
+    if line.startswith(b"\\"):
+        start = line.find(b"\\", 1) + 1
+        if not start:
+            return False
     
-    def start(self) -> None:
-        """Start the AIS handler threads."""
-        if self.running:
-            return
+    end = len(line)
+    while end > start and line[end - 1] in (0x0A, 0x0D):
+        end -= 1
+    star = end - 3
+    if star <= start or line[star] != 0x2A or line[start] not in (0x21, 0x24):  # * ! $
+        return False
+    
+    high = HEX_VALUES[line[star + 1]]
+    low = HEX_VALUES[line[star + 2]]
+    if high > 15 or low > 15:
+        return False
+    return nmea_checksum(line[start + 1:star]) == (high << 4 | low)
+
+
+def tag_block(params: bytes) -> bytes:
+    """
+    Build an NMEA 4.0 TAG block.
+    
+    Args:
+        params: Comma-separated TAG parameters, e.g. b"s:station1"
         
-        self.running = True
+    Returns:
+        The TAG block including its checksum and delimiters
+    """
+    return b"\\%s*%02X\\" % (params, nmea_checksum(params))
+
+
+def add_tag_params(line: bytes, params: bytes) -> bytes:
+    """
+    Add TAG parameters to a sentence, merging with an existing TAG block.
+    
+    Parameters already present in the line's TAG block are kept; only those
+    it does not have are added.
+    
+    Args:
+        line: Sentence, optionally starting with a TAG block
+        params: Comma-separated TAG parameters to add
         
-        # Start producer thread
-        self.producer_thread = threading.Thread(
-            target=self._producer,
-            name="AIS-Producer",
-            daemon=True
-        )
-        self.producer_thread.start()
+    Returns:
+        The sentence with a single TAG block in front
+    """
+    if not line.startswith(b"\\"):
+        return tag_block(params) + line
+    
+    end = line.find(b"\\", 1)
+    if end < 0:
+        return tag_block(params) + line
+    existing = line[1:end].split(b"*", 1)[0]
+    keys = {param.split(b":", 1)[0] for param in existing.split(b",")}
+    extra = [param for param in params.split(b",") if param.split(b":", 1)[0] not in keys]
+    if not extra:
+        return line
+    return tag_block(b",".join([existing] + extra)) + line[end + 1:]
+
+
+class AISRecord(NamedTuple):
+    """A received line and when it was read, as carried through the queues."""
+    data: bytes  # CR LF terminated line(s), shared by every sink
+    received: float  # time.monotonic() at read time
+    timestamp: float  # time.time() at read time
+
+
+def render_records(records: List[AISRecord], tag_timestamp: bool = False) -> List[bytes]:
+    """
+    Turn records into the byte strings to send.
+    
+    Args:
+        records: Records to send, in order
+        tag_timestamp: Add an NMEA 4.0 c: (receive time) TAG parameter
         
-        # Start consumer thread
-        self.consumer_thread = threading.Thread(
-            target=self._consumer,
-            name="AIS-Consumer", 
-            daemon=True
-        )
-        self.consumer_thread.start()
+    Returns:
+        List of byte strings, one per record
+    """
+    if not tag_timestamp:
+        return [record.data for record in records]
+    
+    buffers = []
+    for record in records:
+        params = b"c:%d" % record.timestamp
+        if record.data.count(b"\n") > 1:
+            # Reassembled multi-part message: tag every fragment
+            buffers.append(b"".join(add_tag_params(line, params) for line in record.data.splitlines(keepends=True)))
+        else:
+            buffers.append(add_tag_params(record.data, params))
+    return buffers
+
+
+def load_id_list(value: str) -> Optional[frozenset]:
+    """
+    Parse a list of message types or MMSIs.
+    
+    Args:
+        value: Comma-separated numbers, or the path of an existing file
+            with one number per line (blank lines and # comments are ignored)
         
-        logging.info("AIS handler started")
+    Returns:
+        The numbers as a set, or None if value is empty
+        
+    Raises:
+        ValueError: If an entry is not a number
+        OSError: If the file cannot be read
+    """
+    value = value.strip()
+    if not value:
+        return None
+    if os.path.isfile(value):
+        with open(value) as id_file:
+            entries = [line.split("#", 1)[0].strip() for line in id_file]
+    else:
+        entries = [entry.strip() for entry in value.split(",")]
+    return frozenset(int(entry) for entry in entries if entry)
+
+
+def load_polygons(value: str) -> List[List[Tuple[float, float]]]:
+    """
+    Parse geofence polygons.
     
-    def stop(self) -> None:
-        """Stop the AIS handler threads."""
-        if not self.running:
-            return
+    Args:
+        value: Polygons separated by ";", each a comma-separated list of
+            "lat lon" vertices, or the path of an existing file with one
+            polygon per line (blank lines and # comments are ignored)
         
-        logging.info("Stopping AIS handler...")
-        self.running = False
+    Returns:
+        List of polygons as (lat, lon) vertex lists
         
-        # Wait for threads to terminate (with timeout)
-        if self.producer_thread and self.producer_thread.is_alive():
-            self.producer_thread.join(timeout=5)
+    Raises:
+        ValueError: If a polygon has fewer than 3 vertices or a vertex is malformed
+        OSError: If the file cannot be read
+    """
+    value = value.strip()
+    if os.path.isfile(value):
+        with open(value) as polygon_file:
+            specs = [line.split("#", 1)[0].strip() for line in polygon_file]
+    else:
+        specs = [spec.strip() for spec in value.split(";")]
+    
+    polygons = []
+    for spec in specs:
+        if not spec:
+            continue
+        polygon = []
+        for vertex in spec.split(","):
+            lat, lon = (float(coordinate) for coordinate in vertex.split())
+            polygon.append((lat, lon))
+        if len(polygon) < 3:
+            raise ValueError(f"Geofence polygon needs at least 3 vertices: {spec}")
+        polygons.append(polygon)
+    return polygons
+
+
+class Geofence:
+    """
+    Point-in-polygon test for one polygon, backed by a grid index.
+    
+    At startup the polygon's bounding box is divided into cells of
+    cell_size degrees and every cell is marked inside, outside, or boundary
+    (crossed by a polygon edge). Most points are then accepted or rejected
+    by one cell lookup; only points in boundary cells get an exact
+    point-in-polygon test. The polygon must not cross the antimeridian.
+    """
+    
+    OUTSIDE = 0
+    INSIDE = 1
+    BOUNDARY = 2
+    
+    def __init__(self, polygon: List[Tuple[float, float]], cell_size: float = GEOFENCE_CELL):
+        self.polygon = polygon
+        self.edges = list(zip(polygon, polygon[1:] + polygon[:1]))
+        self.cell_size = cell_size
+        self.min_lat = min(lat for lat, _ in polygon)
+        self.min_lon = min(lon for _, lon in polygon)
+        self.rows, self.cols = self.grid_shape(polygon, cell_size)
+        self.grid = self._rasterize()
+    
+    @staticmethod
+    def grid_shape(polygon: List[Tuple[float, float]], cell_size: float) -> Tuple[int, int]:
+        """
+        Size the grid for a polygon without building it.
         
-        if self.consumer_thread and self.consumer_thread.is_alive():
-            self.consumer_thread.join(timeout=5)
+        Args:
+            polygon: (lat, lon) vertices
+            cell_size: Cell size in degrees
+            
+        Returns:
+            Number of rows and columns
+            
+        Raises:
+            ValueError: If the cell size is not positive or the grid would be too large
+        """
+        if cell_size <= 0:
+            raise ValueError("geofence_cell must be positive")
+        lats = [lat for lat, _ in polygon]
+        lons = [lon for _, lon in polygon]
+        rows = int((max(lats) - min(lats)) / cell_size) + 1
+        cols = int((max(lons) - min(lons)) / cell_size) + 1
+        if rows * cols > GEOFENCE_MAX_CELLS:
+            raise ValueError(f"Geofence grid of {rows}x{cols} cells is too large, increase geofence_cell")
+        return rows, cols
+    
+    def _rasterize(self) -> bytearray:
+        """Classify every cell of the grid."""
+        grid = bytearray(self.rows * self.cols)
+        for (lat1, lon1), (lat2, lon2) in self.edges:
+            for row in range(self._row(min(lat1, lat2)), self._row(max(lat1, lat2)) + 1):
+                # Only the part of the edge within this row's band can cross its cells;
+                # one cell of slack either side absorbs rounding, the clip test decides
+                west, east = min(lon1, lon2), max(lon1, lon2)
+                if lat1 != lat2:
+                    bottom = self.min_lat + row * self.cell_size
+                    band = [lon1 + (min(max(lat, min(lat1, lat2)), max(lat1, lat2)) - lat1) * (lon2 - lon1) / (lat2 - lat1)
+                            for lat in (bottom, bottom + self.cell_size)]
+                    west, east = min(band), max(band)
+                for col in range(max(self._col(west) - 1, 0), min(self._col(east) + 2, self.cols)):
+                    if self._edge_crosses_cell(lat1, lon1, lat2, lon2, row, col):
+                        grid[row * self.cols + col] = self.BOUNDARY
         
-        # Close connections
-        self._close_serial()
-        self.socket_manager.close()
+        # No edge crosses the other cells, so their centre decides for the whole cell.
+        # Each row's centre line is crossed by the edges at an even number of
+        # longitudes, and the centres between the first and second crossing,
+        # third and fourth, and so on are inside (the rule _exact() applies),
+        # so each such span is filled at once, leaving boundary cells as they are
+        fill = bytes.maketrans(bytes([self.OUTSIDE]), bytes([self.INSIDE]))
+        for row in range(self.rows):
+            lat = self.min_lat + (row + 0.5) * self.cell_size
+            crossings = sorted(
+                lon1 + (lat - lat1) * (lon2 - lon1) / (lat2 - lat1)
+                for (lat1, lon1), (lat2, lon2) in self.edges
+                if (lat1 > lat) != (lat2 > lat)
+            )
+            for enter, leave in zip(crossings[::2], crossings[1::2]):
+                first = max(math.ceil((enter - self.min_lon) / self.cell_size - 0.5), 0)
+                last = min(math.ceil((leave - self.min_lon) / self.cell_size - 0.5), self.cols)
+                if first < last:
+                    start = row * self.cols
+                    grid[start + first:start + last] = grid[start + first:start + last].translate(fill)
+        return grid
+    
+    def _row(self, lat: float) -> int:
+        return min(int((lat - self.min_lat) / self.cell_size), self.rows - 1)
+    
+    def _col(self, lon: float) -> int:
+        return min(int((lon - self.min_lon) / self.cell_size), self.cols - 1)
+    
+    def _edge_crosses_cell(self, lat1: float, lon1: float, lat2: float, lon2: float, row: int, col: int) -> bool:
+        """Clip an edge against a cell (Liang-Barsky) and report whether any of it is left."""
+        bottom = self.min_lat + row * self.cell_size
+        left = self.min_lon + col * self.cell_size
+        start, end = 0.0, 1.0
+        for delta, distance in (
+            (lon1 - lon2, lon1 - left),
+            (lon2 - lon1, left + self.cell_size - lon1),
+            (lat1 - lat2, lat1 - bottom),
+            (lat2 - lat1, bottom + self.cell_size - lat1),
+        ):
+            if delta == 0:
+                if distance < 0:
+                    return False
+            else:
+                ratio = distance / delta
+                if delta < 0:
+                    start = max(start, ratio)
+                else:
+                    end = min(end, ratio)
+                if start > end:
+                    return False
+        return True
+    
+    def _exact(self, lat: float, lon: float) -> bool:
+        """Ray casting point-in-polygon test."""
+        inside = False
+        for (lat1, lon1), (lat2, lon2) in self.edges:
+            if (lat1 > lat) != (lat2 > lat):
+                if lon < lon1 + (lat - lat1) * (lon2 - lon1) / (lat2 - lat1):
+                    inside = not inside
+        return inside
+    
+    def contains(self, lat: float, lon: float) -> bool:
+        """Return True if the position is inside the polygon."""
+        row = int((lat - self.min_lat) / self.cell_size)
+        col = int((lon - self.min_lon) / self.cell_size)
+        if not (0 <= row < self.rows and 0 <= col < self.cols and lat >= self.min_lat and lon >= self.min_lon):
+            return False
+        cell = self.grid[row * self.cols + col]
+        if cell == self.BOUNDARY:
+            return self._exact(lat, lon)
+        return cell == self.INSIDE
+
+
+class MessageFilter:
+    """
+    Selects the messages an output forwards by message type, MMSI and area.
+    
+    The type and MMSI are read from the first payload characters without
+    decoding the message. A message passes if it is in the allow lists (when
+    set) and not in the deny lists. With geofences, position reports are
+    decoded and pass when inside one of them; other messages pass for
+    vessels whose last position was inside. Lines without a readable header, such as
+    other NMEA sentences or later fragments of a multi-part message that was
+    not reassembled, always pass. Like the vessel cache, a vessel is
+    forgotten when it has not reported a position inside for inside_ttl
+    seconds, and at most max_inside vessels are remembered.
+    """
+    
+    def __init__(self, allow_types: Optional[frozenset] = None, deny_types: Optional[frozenset] = None,
+                 allow_mmsi: Optional[frozenset] = None, deny_mmsi: Optional[frozenset] = None,
+                 geofences: Optional[List[Geofence]] = None, inside_ttl: float = VESSEL_TTL,
+                 max_inside: int = VESSEL_CACHE_SIZE):
+        self.allow_types = allow_types
+        self.deny_types = deny_types or frozenset()
+        self.allow_mmsi = allow_mmsi
+        self.deny_mmsi = deny_mmsi or frozenset()
+        self.geofences = geofences or []
+        self.inside_ttl = inside_ttl
+        self.max_inside = max_inside
+        # MMSI -> time of the last position inside a geofence; insertion order
+        # is report order, so the vessel reported longest ago is first
+        self.inside_mmsi: Dict[int, float] = {}
+    
+    @classmethod
+    def from_config(cls, config: OutputConfig) -> Optional["MessageFilter"]:
+        """
+        Build the filter for an output.
+        
+        Args:
+            config: Output settings
+            
+        Returns:
+            MessageFilter, or None if the output has no filter settings
+            
+        Raises:
+            ValueError: If a list entry is not a number
+            OSError: If a list file cannot be read
+        """
+        lists = [load_id_list(value) for value in
+                 (config.allow_types, config.deny_types, config.allow_mmsi, config.deny_mmsi)]
+        geofences = [Geofence(polygon, config.geofence_cell) for polygon in load_polygons(config.geofence)]
+        if not geofences and not any(id_list is not None for id_list in lists):
+            return None
+        return cls(*lists, geofences)
+    
+    def accepts(self, data: bytes) -> bool:
+        """Return True if the line(s) should be forwarded."""
+        header = peek_header(data)
+        if header is None:
+            return True
+        msg_type, mmsi = header
+        if msg_type in self.deny_types or mmsi in self.deny_mmsi:
+            return False
+        if self.allow_types is not None and msg_type not in self.allow_types:
+            return False
+        if self.allow_mmsi is not None and mmsi not in self.allow_mmsi:
+            return False
+        if self.geofences:
+            return self._in_geofence(data, mmsi)
+        return True
+    
+    def _in_geofence(self, data: bytes, mmsi: int) -> bool:
+        """Check a message's position, or its vessel's last position, against the geofences."""
+        now = time.monotonic()
+        self._expire(now)
+        message = decode_sentence(data)
+        lat = getattr(message, "lat", None)
+        lon = getattr(message, "lon", None)
+        if lat is None or lon is None or abs(lat) > 90 or abs(lon) > 180:
+            # No (valid) position in this message
+            return mmsi in self.inside_mmsi
+        
+        # Removed first so that a vessel still inside moves to the end
+        self.inside_mmsi.pop(mmsi, None)
+        if any(geofence.contains(lat, lon) for geofence in self.geofences):
+            self.inside_mmsi[mmsi] = now
+            if len(self.inside_mmsi) > self.max_inside:
+                self.inside_mmsi.pop(next(iter(self.inside_mmsi)), None)
+            return True
+        return False
+    
+    def _expire(self, now: float) -> None:
+        """Forget vessels not reported inside for inside_ttl seconds."""
+        # Inputs may dispatch from several threads, so entries can vanish meanwhile
+        while self.inside_mmsi:
+            mmsi = next(iter(self.inside_mmsi))
+            if now - self.inside_mmsi.get(mmsi, 0.0) < self.inside_ttl:
+                break
+            self.inside_mmsi.pop(mmsi, None)
+
+
+class Downsampler:
+    """
+    Thins vessel position reports to one per MMSI per interval.
+    
+    The interval is chosen from the report being considered so that a vessel
+    moves about the same distance between forwarded reports: min_interval at
+    DOWNSAMPLE_FAST_SPEED knots and above, while turning or when the speed
+    is unknown, and max_interval when anchored, moored or slower than
+    DOWNSAMPLE_SLOW_SPEED. Reports arriving within min_interval of the last
+    forwarded one are dropped without decoding. Static, safety and all other
+    messages pass.
+    """
+    
+    def __init__(self, min_interval: float = DOWNSAMPLE_MIN_INTERVAL,
+                 max_interval: float = DOWNSAMPLE_MAX_INTERVAL):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        # MMSI -> receive time of the last forwarded position report
+        self.last_sent: Dict[int, float] = {}
+        self.pruned_at = time.monotonic()
+    
+    @classmethod
+    def from_config(cls, config: OutputConfig) -> Optional["Downsampler"]:
+        """Build the downsampler for an output, or return None if it is disabled."""
+        if not config.downsample:
+            return None
+        return cls(config.downsample_min_interval, config.downsample_max_interval)
+    
+    def accepts(self, record: AISRecord) -> bool:
+        """Return True if a record should be forwarded; call mark_sent() once it is queued."""
+        header = peek_header(record.data)
+        if header is None or header[0] not in DOWNSAMPLE_TYPES:
+            return True
+        
+        msg_type, mmsi = header
+        now = record.received
+        last = self.last_sent.get(mmsi)
+        if last is not None:
+            elapsed = now - last
+            if elapsed < self.min_interval:
+                return False
+            if elapsed < self.max_interval and elapsed < self.interval(record.data, msg_type):
+                return False
+        return True
+    
+    def mark_sent(self, record: AISRecord) -> None:
+        """Start the interval of the record's vessel, if it is a position report."""
+        header = peek_header(record.data)
+        if header is None or header[0] not in DOWNSAMPLE_TYPES:
+            return
+        
+        now = record.received
+        self.last_sent[header[1]] = now
+        if now - self.pruned_at >= self.max_interval:
+            self._prune(now)
+    
+    def interval(self, data: bytes, msg_type: int) -> float:
+        """Return the seconds to wait after a position report before forwarding another."""
+        message = decode_sentence(data)
+        if message is None:
+            return self.min_interval
+        if getattr(message, "status", None) in (1, 5):
+            return self.max_interval  # at anchor or moored
+        
+        turn = getattr(message, "turn", None)
+        if turn is not None and turn != -128 and abs(turn) >= DOWNSAMPLE_TURN:
+            return self.min_interval
+        
+        speed = message.speed
+        if speed is None or speed >= (63 if msg_type == 27 else 102.3):
+            return self.min_interval  # not available
+        if speed < DOWNSAMPLE_SLOW_SPEED:
+            return self.max_interval
+        return min(max(self.min_interval * DOWNSAMPLE_FAST_SPEED / speed, self.min_interval), self.max_interval)
+    
+    def _prune(self, now: float) -> None:
+        """Forget vessels whose next report would pass anyway."""
+        cutoff = now - self.max_interval
+        # Inputs may dispatch from several threads; copy before iterating
+        for mmsi, sent in list(self.last_sent.items()):
+            if sent < cutoff:
+                self.last_sent.pop(mmsi, None)
+        self.pruned_at = now
+
+
+def vessel_slot(data: bytes) -> Optional[Tuple[int, str]]:
+    """
+    Classify a sentence as a vessel's position or static report.
+    
+    Args:
+        data: Sentence or reassembled multi-part message, as forwarded
+    
+    Returns:
+        Tuple of MMSI and slot ("position", "static" or "static_b" for
+        type 24 part B), or None for other messages and for an unassembled
+        first fragment of a type 5 message
+    """
+    header = peek_header(data)
+    if header is None:
+        return None
+    msg_type, mmsi = header
+    if msg_type in POSITION_TYPES:
+        return mmsi, "position"
+    if msg_type == 5:
+        if data.count(b"\n") < 2:
+            return None  # first fragment only, without reassembly
+        return mmsi, "static"
+    if msg_type == 24:
+        message = decode_sentence(data)
+        return mmsi, "static_b" if message and message.partno == 1 else "static"
+    return None
+
+
+def compact_records(records: List[AISRecord]) -> List[AISRecord]:
+    """
+    Drop position and static reports superseded by a later one from the same vessel.
+    
+    Args:
+        records: Records in delivery order
+    
+    Returns:
+        The newest record per vessel and slot (see vessel_slot()) and every
+        other record, in their original order
+    """
+    slots = [vessel_slot(record.data) for record in records]
+    latest = {slot: index for index, slot in enumerate(slots) if slot is not None}
+    return [
+        record for index, (record, slot) in enumerate(zip(records, slots))
+        if slot is None or latest[slot] == index
+    ]
+
+
+class VesselState:
+    """Latest messages seen from one vessel, as received."""
+    
+    __slots__ = ("mmsi", "position", "static", "static_b", "last_seen", "expiry_tick")
+    
+    def __init__(self, mmsi: int):
+        self.mmsi = mmsi
+        self.position: Optional[AISRecord] = None
+        self.static: Optional[AISRecord] = None  # type 5, or type 24 part A
+        self.static_b: Optional[AISRecord] = None  # type 24 part B
+        self.last_seen = 0.0
+        self.expiry_tick = 0
+    
+    def records(self) -> List[AISRecord]:
+        """Return the vessel's static then position records."""
+        return [record for record in (self.static, self.static_b, self.position) if record]
+    
+    def decode_position(self):
+        """Decode the latest position report, or return None."""
+        return decode_sentence(self.position.data) if self.position else None
+
+
+class VesselCache:
+    """
+    In-memory table of the vessels seen recently, keyed by MMSI.
+    
+    Keeps each vessel's latest position report and static data (type 5,
+    type 24 parts A and B) as received, so they can be replayed or decoded
+    on demand. Only the message header is read on update. Vessels expire
+    vessel_ttl seconds after their last message; expiry is driven by a
+    timing wheel of buckets holding the vessels due in each tick, so
+    advancing time only touches vessels that are due. When max_vessels is
+    reached the vessel closest to expiry is evicted.
+    """
+    
+    def __init__(self, ttl: float = VESSEL_TTL, max_vessels: int = VESSEL_CACHE_SIZE, slots: int = VESSEL_WHEEL_SLOTS):
+        self.ttl = ttl
+        self.max_vessels = max_vessels
+        self.slots = slots
+        self.tick_length = ttl / slots
+        self.vessels: Dict[int, VesselState] = {}
+        self.wheel = [set() for _ in range(slots)]
+        self.tick = int(time.monotonic() / self.tick_length)
+        self.stats = Counter()
+        self.lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        return len(self.vessels)
+    
+    def update(self, record: AISRecord) -> None:
+        """Store a received record if it is a position or static report."""
+        vessel_report = vessel_slot(record.data)
+        if vessel_report is None:
+            return
+        mmsi, slot = vessel_report
+        
+        with self.lock:
+            self._advance(record.received)
+            vessel = self.vessels.get(mmsi)
+            if vessel is None:
+                if len(self.vessels) >= self.max_vessels:
+                    self._evict()
+                vessel = self.vessels[mmsi] = VesselState(mmsi)
+            else:
+                self.wheel[vessel.expiry_tick % self.slots].discard(mmsi)
+            setattr(vessel, slot, record)
+            vessel.last_seen = record.received
+            vessel.expiry_tick = self.tick + self.slots
+            self.wheel[vessel.expiry_tick % self.slots].add(mmsi)
+    
+    def get(self, mmsi: int) -> Optional[VesselState]:
+        """Return the state of one vessel, or None if it is not in view."""
+        with self.lock:
+            self._advance(time.monotonic())
+            return self.vessels.get(mmsi)
+    
+    def snapshot(self) -> List[VesselState]:
+        """Return the vessels currently in view."""
+        with self.lock:
+            self._advance(time.monotonic())
+            return list(self.vessels.values())
+    
+    def records(self, message_filter: Optional[MessageFilter] = None) -> List[AISRecord]:
+        """
+        Return the cached records of every vessel in view, static data first.
+        
+        Args:
+            message_filter: Only include records this filter accepts
+            
+        Returns:
+            List of records, static data of all vessels before their positions
+        """
+        vessels = self.snapshot()
+        records = [record for vessel in vessels for record in (vessel.static, vessel.static_b) if record]
+        records += [vessel.position for vessel in vessels if vessel.position]
+        if message_filter:
+            records = [record for record in records if message_filter.accepts(record.data)]
+        return records
+    
+    def status(self) -> Dict[str, int]:
+        """Return counters for monitoring."""
+        status = {"vessels": len(self.vessels)}
+        status.update(self.stats)
+        return status
+    
+    def _advance(self, now: float) -> None:
+        """Expire the vessels in every bucket passed since the last call."""
+        tick = int(now / self.tick_length)
+        if tick <= self.tick:
+            return
+        # After a gap longer than the wheel, every bucket is due once
+        for expired_tick in range(max(self.tick + 1, tick - self.slots + 1), tick + 1):
+            bucket = self.wheel[expired_tick % self.slots]
+            for mmsi in bucket:
+                del self.vessels[mmsi]
+            self.stats["expired"] += len(bucket)
+            bucket.clear()
+        self.tick = tick
+    
+    def _evict(self) -> None:
+        """Remove the vessel closest to expiry to make room."""
+        for offset in range(1, self.slots + 1):
+            bucket = self.wheel[(self.tick + offset) % self.slots]
+            if bucket:
+                del self.vessels[bucket.pop()]
+                self.stats["evicted"] += 1
+                return
+
+
+class SocketManager:
+    """
+    Manages a TCP socket connection with background reconnection.
+    
+    A connector thread owns connection attempts and the exponential backoff
+    schedule, so send() never blocks on connect(). While disconnected, sends
+    fail immediately and callers can wait on wait_connected(). on_connect,
+    if set, is called from the connector thread after every connection.
+    """
+    
+    def __init__(self, host: str, port: int, max_retries: int = 3):
+        self.host = host
+        self.port = port
+        self.max_retries = max_retries
+        self.socket = None
+        self.socket_lock = threading.Lock()
+        self.connected = False
+        self.connected_event = threading.Event()
+        self.reconnect_event = threading.Event()
+        self.backoff_delay = RECONNECT_DELAY
+        self.running = False
+        self.connector_thread = None
+        self.on_connect: Optional[Callable[[], None]] = None
+    
+    def start(self) -> None:
+        """Start the background connector thread."""
+        if self.running:
+            return
+        
+        self.running = True
+        self.reconnect_event.set()
+        self.connector_thread = threading.Thread(
+            target=self._connector,
+            name=f"AIS-Connector-{self.host}:{self.port}",
+            daemon=True
+        )
+        self.connector_thread.start()
+    
+    def wait_connected(self, timeout: float) -> bool:
+        """
+        Wait until the socket is connected.
+        
+        Args:
+            timeout: Maximum seconds to wait
+            
+        Returns:
+            bool: True if connected, False if the timeout expired
+        """
+        return self.connected_event.wait(timeout)
+    
+    def _connector(self) -> None:
+        """Reconnect whenever the connection is lost, with exponential backoff."""
+        while self.running:
+            self.reconnect_event.wait()
+            if not self.running:
+                break
+            
+            if self.connect():
+                continue
+            
+            # Sleep through the backoff delay; close() wakes us up early
+            self.reconnect_event.clear()
+            self.reconnect_event.wait(self.backoff_delay)
+            self.reconnect_event.set()
+            self.backoff_delay = min(self.backoff_delay * BACKOFF_FACTOR, MAX_BACKOFF_DELAY)
+    
+    def connect(self) -> bool:
+        """
+        Make one attempt to establish the connection.
+        
+        The blocking connect runs without holding socket_lock, so concurrent
+        send() calls fail fast instead of waiting for it.
+        
+        Returns:
+            bool: True if connection successful, False otherwise
+        """
+        if self.connected:
+            return True
+        
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            sock.settimeout(SOCKET_TIMEOUT)
+            sock.connect((self.host, self.port))
+        except socket.error as e:
+            logging.warning(f"Failed to connect to {self.host}:{self.port}: {e}")
+            sock.close()
+            return False
+        
+        with self.socket_lock:
+            if self.socket:
+                self.socket.close()
+            self.socket = sock
+            # Cleared before senders can see the connection, so a reset that
+            # _disconnected() signals from here on is never lost
+            self.reconnect_event.clear()
+            self.connected = True
+            # Reset backoff on successful connection
+            self.backoff_delay = RECONNECT_DELAY
+            self.connected_event.set()
+        logging.info(f"Connected to {self.host}:{self.port}")
+        if self.on_connect:
+            self.on_connect()
+        return True
+    
+    def _disconnected(self) -> None:
+        """Drop the broken connection and wake the connector. Hold socket_lock."""
+        self.connected = False
+        self.connected_event.clear()
+        if self.socket:
+            try:
+                self.socket.close()
+            except Exception:
+                pass
+            self.socket = None
+        self.reconnect_event.set()
+    
+    def send(self, data: bytes) -> bool:
+        """
+        Send data through the socket.
+        
+        Args:
+            data: Bytes to send
+            
+        Returns:
+            bool: True if send successful, False if not connected or the send failed
+        """
+        with self.socket_lock:
+            if not self.connected:
+                return False
+            
+            try:
+                self.socket.sendall(data)
+                return True
+            except socket.error as e:
+                logging.warning(f"Error sending data to {self.host}:{self.port}: {e}")
+                self._disconnected()
+                return False
+    
+    def send_batch(self, buffers: List[bytes]) -> bool:
+        """
+        Send several buffers through the socket with a single vectored write.
+        
+        Args:
+            buffers: Byte strings to send, in order
+            
+        Returns:
+            bool: True if every buffer was sent, False otherwise
+        """
+        with self.socket_lock:
+            if not self.connected:
+                return False
+            
+            try:
+                if hasattr(self.socket, "sendmsg"):
+                    self._sendmsg_all(buffers)
+                else:
+                    self.socket.sendall(b"".join(buffers))
+                return True
+            except socket.error as e:
+                logging.warning(f"Error sending data to {self.host}:{self.port}: {e}")
+                self._disconnected()
+                return False
+    
+    def _sendmsg_all(self, buffers: List[bytes]) -> None:
+        """Write all buffers with sendmsg(), resuming after partial writes."""
+        views = [memoryview(buf) for buf in buffers]
+        index = 0
+        while index < len(views):
+            sent = self.socket.sendmsg(views[index:])
+            # Skip the buffers that went out completely, trim the partial one
+            while index < len(views) and sent >= len(views[index]):
+                sent -= len(views[index])
+                index += 1
+            if sent:
+                views[index] = views[index][sent:]
+    
+    def close(self) -> None:
+        """Stop the connector and close the socket connection."""
+        self.running = False
+        self.reconnect_event.set()
+        if self.connector_thread and self.connector_thread.is_alive():
+            self.connector_thread.join(timeout=SOCKET_TIMEOUT + 1)
+        
+        with self.socket_lock:
+            if self.socket:
+                try:
+                    self.socket.close()
+                except Exception as e:
+                    logging.warning(f"Error closing socket: {e}")
+                finally:
+                    self.connected = False
+                    self.connected_event.clear()
+                    self.socket = None
+
+
+class UDPSender:
+    """
+    Sends data as UDP datagrams, packing whole sentences up to the MTU.
+    
+    There is no connection to establish, so sends never wait on a connect
+    timeout or reconnect backoff. Multicast and broadcast destinations are
+    supported.
+    """
+    
+    def __init__(self, host: str, port: int, mtu: int = UDP_MTU,
+                 multicast_ttl: int = 1, broadcast: bool = False):
+        self.host = host
+        self.port = port
+        self.max_datagram = mtu - IP_UDP_OVERHEAD
+        self.multicast_ttl = multicast_ttl
+        self.broadcast = broadcast
+        self.socket = None
+        self.address = None
+        self.socket_lock = threading.Lock()
+    
+    @property
+    def connected(self) -> bool:
+        """True once the socket has been created."""
+        return self.socket is not None
+    
+    def start(self) -> None:
+        """Create the socket up front; there is nothing to reconnect."""
+        self.connect()
+    
+    def wait_connected(self, timeout: float) -> bool:
+        """Return True if the socket is ready, retrying setup after timeout."""
+        if self.connected or self.connect():
+            return True
+        time.sleep(timeout)
+        return self.connect()
+    
+    def connect(self, resolved: Optional[str] = None) -> bool:
+        """
+        Create the UDP socket and resolve the destination address.
+        
+        Args:
+            resolved: IPv4 address of the host if the caller has already
+                looked it up, e.g. without blocking an event loop
+        
+        Returns:
+            bool: True if the socket is ready, False otherwise
+        """
+        with self.socket_lock:
+            if self.socket:
+                return True
+            
+            try:
+                address = (resolved or socket.gethostbyname(self.host), self.port)
+                sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                if self.broadcast:
+                    sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+                if ipaddress.ip_address(address[0]).is_multicast:
+                    sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, self.multicast_ttl)
+                self.address = address
+                self.socket = sock
+                logging.info(f"Sending UDP to {self.host}:{self.port}")
+                return True
+            except socket.error as e:
+                logging.warning(f"Failed to set up UDP socket for {self.host}:{self.port}: {e}")
+                return False
+    
+    def send(self, data: bytes) -> bool:
+        """
+        Send data as a single datagram.
+        
+        Args:
+            data: Bytes to send
+            
+        Returns:
+            bool: True if send successful, False otherwise
+        """
+        return self.send_batch([data])
+    
+    def send_batch(self, buffers: List[bytes]) -> bool:
+        """
+        Send buffers packed into as few datagrams as the MTU allows.
+        
+        Buffers are never split across datagrams; one larger than the
+        datagram limit is sent on its own.
+        
+        Args:
+            buffers: Byte strings to send, in order
+            
+        Returns:
+            bool: True if every datagram was sent, False otherwise
+        """
+        if not self.connected and not self.connect():
+            return False
+        
+        try:
+            datagram = []
+            size = 0
+            for buf in buffers:
+                if datagram and size + len(buf) > self.max_datagram:
+                    self.socket.sendto(b"".join(datagram), self.address)
+                    datagram = []
+                    size = 0
+                datagram.append(buf)
+                size += len(buf)
+            if datagram:
+                self.socket.sendto(b"".join(datagram), self.address)
+            return True
+        except socket.error as e:
+            logging.warning(f"Error sending UDP data to {self.host}:{self.port}: {e}")
+            return False
+    
+    def close(self) -> None:
+        """Close the socket."""
+        with self.socket_lock:
+            if self.socket:
+                try:
+                    self.socket.close()
+                except Exception as e:
+                    logging.warning(f"Error closing socket: {e}")
+                finally:
+                    self.socket = None
+
+
+class TCPServerSender:
+    """
+    Listens for TCP clients and broadcasts every send to all of them.
+    
+    Each send is joined into one bytes object shared by every client and
+    written with non-blocking sends. Whatever a client cannot take yet is
+    buffered for it and flushed by the server thread when the socket becomes
+    writable; a client whose buffer exceeds client_buffer bytes has fallen
+    behind and is disconnected. Sends never fail, so the sink never retries
+    or spools; with no clients connected, data is discarded. on_connect, if
+    set, is called from the server thread with every new client socket.
+    """
+    
+    def __init__(self, host: str, port: int, client_buffer: int = CLIENT_BUFFER_BYTES):
+        self.host = host
+        self.port = port
+        self.client_buffer = client_buffer
+        self.server = None
+        # Unsent bytes per client socket
+        self.clients: Dict[socket.socket, bytearray] = {}
+        self.addresses: Dict[socket.socket, str] = {}
+        # Clients dropped by send_batch(), closed by the server thread
+        self.closing: List[socket.socket] = []
+        self.clients_lock = threading.Lock()
+        self.evicted = 0
+        self.running = False
+        self.server_thread = None
+        self.on_connect: Optional[Callable[[socket.socket], None]] = None
+    
+    @property
+    def connected(self) -> bool:
+        """True once the server is listening."""
+        return self.server is not None
+    
+    def start(self) -> None:
+        """Open the listening socket and start the server thread."""
+        if self.running:
+            return
+        
+        self.running = True
+        self.server_thread = threading.Thread(
+            target=self._serve,
+            name=f"AIS-Server-{self.host}:{self.port}",
+            daemon=True
+        )
+        self.server_thread.start()
+    
+    def wait_connected(self, timeout: float) -> bool:
+        """Wait for the server to be listening."""
+        if not self.connected:
+            time.sleep(timeout)
+        return self.connected
+    
+    def _listen(self) -> bool:
+        """Open the listening socket, returning False on failure."""
+        try:
+            self.server = socket.create_server((self.host, self.port))
+            self.server.setblocking(False)
+            logging.info(f"Serving NMEA to clients on {self.host}:{self.port}")
+            return True
+        except OSError as e:
+            logging.error(f"Failed to listen on {self.host}:{self.port}: {e}")
+            return False
+    
+    def _serve(self) -> None:
+        """Accept clients, flush their buffers and notice disconnects until stopped."""
+        while not self._listen():
+            time.sleep(RECONNECT_DELAY)
+            if not self.running:
+                return
+        
+        selector = selectors.DefaultSelector()
+        selector.register(self.server, selectors.EVENT_READ)
+        try:
+            while self.running:
+                with self.clients_lock:
+                    for sock in self.closing:
+                        selector.unregister(sock)
+                        sock.close()
+                    self.closing.clear()
+                    for sock, pending in self.clients.items():
+                        events = selectors.EVENT_READ | (selectors.EVENT_WRITE if pending else 0)
+                        if selector.get_key(sock).events != events:
+                            selector.modify(sock, events)
+                
+                # Short timeout so buffers filled by send_batch() meanwhile are picked up
+                for key, mask in selector.select(timeout=0.1):
+                    if key.fileobj is self.server:
+                        self._accept(selector)
+                        continue
+                    with self.clients_lock:
+                        if key.fileobj not in self.clients:
+                            continue
+                        if mask & selectors.EVENT_READ:
+                            self._read_client(key.fileobj)
+                        if mask & selectors.EVENT_WRITE and key.fileobj in self.clients:
+                            self._flush(key.fileobj)
+        except Exception as e:
+            logging.error(f"Unexpected error in server for {self.host}:{self.port}: {e}")
+        finally:
+            with self.clients_lock:
+                for sock in list(self.clients) + self.closing:
+                    sock.close()
+                self.clients.clear()
+                self.addresses.clear()
+                self.closing.clear()
+            selector.close()
+            self.server.close()
+            self.server = None
+    
+    def _accept(self, selector: selectors.BaseSelector) -> None:
+        """Accept a pending client."""
+        try:
+            sock, address = self.server.accept()
+        except OSError:
+            return
+        sock.setblocking(False)
+        with self.clients_lock:
+            self.clients[sock] = bytearray()
+            self.addresses[sock] = f"{address[0]}:{address[1]}"
+        selector.register(sock, selectors.EVENT_READ)
+        logging.info(f"Client {address[0]}:{address[1]} connected to {self.host}:{self.port}")
+        if self.on_connect:
+            self.on_connect(sock)
+    
+    def _read_client(self, sock: socket.socket) -> None:
+        """Discard anything a client sends and drop it when it disconnects. Hold clients_lock."""
+        try:
+            if sock.recv(RECV_SIZE):
+                return
+        except BlockingIOError:
+            return
+        except OSError:
+            pass
+        self._drop(sock)
+    
+    def _flush(self, sock: socket.socket) -> None:
+        """Write as much of a client's buffer as it takes. Hold clients_lock."""
+        pending = self.clients[sock]
+        try:
+            sent = sock.send(pending)
+        except BlockingIOError:
+            return
+        except OSError:
+            self._drop(sock)
+            return
+        del pending[:sent]
+    
+    def _drop(self, sock: socket.socket) -> None:
+        """Forget a client and have the server thread close it. Hold clients_lock."""
+        del self.clients[sock]
+        self.closing.append(sock)
+        logging.info(f"Client {self.addresses.pop(sock)} disconnected from {self.host}:{self.port}")
+    
+    def send(self, data: bytes) -> bool:
+        """Broadcast data to every client."""
+        return self.send_batch([data])
+    
+    def send_batch(self, buffers: List[bytes]) -> bool:
+        """
+        Broadcast buffers to every client without blocking.
+        
+        Args:
+            buffers: Byte strings to send, in order
+            
+        Returns:
+            bool: Always True; clients that fall behind are disconnected instead
+        """
+        data = b"".join(buffers)
+        with self.clients_lock:
+            for sock in list(self.clients):
+                self._write(sock, data)
+        return True
+    
+    def send_to(self, sock: socket.socket, buffers: List[bytes]) -> bool:
+        """
+        Send buffers to one client without blocking.
+        
+        Args:
+            sock: Client socket passed to on_connect
+            buffers: Byte strings to send, in order
+            
+        Returns:
+            bool: True if the client is still connected, False otherwise
+        """
+        with self.clients_lock:
+            return sock in self.clients and self._write(sock, b"".join(buffers))
+    
+    def _write(self, sock: socket.socket, data: bytes) -> bool:
+        """Send data to a client or buffer it, dropping the client if it falls behind. Hold clients_lock."""
+        pending = self.clients[sock]
+        if pending:
+            pending += data
+        else:
+            try:
+                sent = sock.send(data)
+            except BlockingIOError:
+                sent = 0
+            except OSError:
+                self._drop(sock)
+                return False
+            pending += data[sent:]
+        
+        if len(pending) > self.client_buffer:
+            logging.warning(f"Client {self.addresses[sock]} of {self.host}:{self.port} fell behind by {len(pending)} bytes, disconnecting")
+            self.evicted += 1
+            self._drop(sock)
+            return False
+        return True
+    
+    def close(self) -> None:
+        """Stop the server thread and disconnect every client."""
+        self.running = False
+        if self.server_thread and self.server_thread.is_alive():
+            self.server_thread.join(timeout=5)
+
+
+class DiskSpool:
+    """
+    Append-only, segment-based on-disk store for data awaiting delivery.
+    
+    Records are framed with their length and receive time and appended to
+    numbered segment files. The
+    oldest segment is replayed first and deleted once it has been fully
+    acknowledged; when the spool grows past max_bytes the oldest segments are
+    discarded. With compact set, the spool is first rewritten without
+    superseded vessel reports (see compact_records()), at most once per
+    COMPACT_MIN_GROWTH of max_bytes appended. Compaction runs in its own
+    thread on the segments sealed when it started, so appends and reads
+    carry on meanwhile and the spool may exceed max_bytes until it is done.
+    Delivery is at-least-once: after a restart the partially drained segment
+    is replayed from its start, and up to COMPACT_CHECKPOINT records read
+    during a compaction are sent again.
+    """
+    
+    SUFFIX = ".spool"
+    # Compacted copies of sealed segments, renamed over them when complete
+    COMPACT_SUFFIX = ".compact"
+    FRAME = struct.Struct("<Id")  # length, wall-clock receive time
+    
+    def __init__(self, directory: str, max_bytes: int = SPOOL_MAX_BYTES,
+                 segment_bytes: int = SPOOL_SEGMENT_BYTES,
+                 fsync_interval: float = SPOOL_FSYNC_INTERVAL, compact: bool = False):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.fsync_interval = fsync_interval
+        self.compact = compact
+        self.compacted = 0
+        # Bytes appended since the last compaction
+        self.growth = 0
+        self.lock = threading.Lock()
+        self.not_empty = threading.Event()
+        self.writer = None
+        self.unsynced = False
+        self.last_fsync = time.monotonic()
+        self.read_offset = 0
+        self.pending: Optional[Tuple[int, int]] = None
+        # Segments being compacted; their files outlive _remove_oldest() until it is done
+        self.compacting: Optional[List[int]] = None
+        
+        os.makedirs(directory, exist_ok=True)
+        for name in os.listdir(directory):
+            if name.endswith(self.COMPACT_SUFFIX):
+                # Left by a compaction that was interrupted
+                os.remove(os.path.join(directory, name))
+        self.segments: List[int] = sorted(
+            int(name[:-len(self.SUFFIX)])
+            for name in os.listdir(directory)
+            if name.endswith(self.SUFFIX) and name[:-len(self.SUFFIX)].isdigit()
+        )
+        self.sizes: Dict[int, int] = {
+            seq: os.path.getsize(self._path(seq)) for seq in self.segments
+        }
+        self.size = sum(self.sizes.values())
+        if self.size:
+            logging.info(f"Spool {directory} holds {self.size} bytes from a previous run")
+            self.not_empty.set()
+    
+    def _path(self, seq: int, suffix: str = SUFFIX) -> str:
+        """Return the file path of a segment, or of its compacted copy."""
+        return os.path.join(self.directory, f"{seq:010d}{suffix}")
+    
+    def is_empty(self) -> bool:
+        """Return True if there is no undelivered data in the spool."""
+        return self.size == 0
+    
+    def wait(self, timeout: float) -> bool:
+        """Wait until the spool holds data. Returns True if it does."""
+        return self.not_empty.wait(timeout)
+    
+    def append(self, records: List[AISRecord]) -> None:
+        """
+        Append records to the newest segment.
+        
+        Args:
+            records: Records to store, in delivery order
+        """
+        payload = b"".join(
+            self.FRAME.pack(len(record.data), record.timestamp) + record.data for record in records
+        )
+        with self.lock:
+            if self.writer is None or self.sizes[self.segments[-1]] >= self.segment_bytes:
+                self._rotate()
+            self.writer.write(payload)
+            self.writer.flush()
+            self.sizes[self.segments[-1]] += len(payload)
+            self.size += len(payload)
+            self.growth += len(payload)
+            self.unsynced = True
+            self.not_empty.set()
+            
+            if (self.size > self.max_bytes and self.compact and self.compacting is None
+                    and self.growth >= self.max_bytes * COMPACT_MIN_GROWTH):
+                self._start_compaction()
+            
+            self._enforce_budget()
+            self._sync_if_due()
+    
+    def read_batch(self, max_count: int, max_bytes: int) -> List[AISRecord]:
+        """
+        Read the oldest undelivered records without consuming them.
+        
+        Call ack() after the records have been delivered; otherwise the next
+        call returns the same records again.
+        
+        Args:
+            max_count: Maximum number of records to read
+            max_bytes: Stop reading once this many bytes have been collected
+            
+        Returns:
+            List of records in order, empty if the spool is empty
+        """
+        with self.lock:
+            self.pending = None
+            while self.segments:
+                seq = self.segments[0]
+                writing = self.writer is not None and seq == self.segments[-1]
+                end = self.sizes[seq]
+                if self.read_offset >= end:
+                    if writing:
+                        return []
+                    self._remove_oldest()
+                    continue
+                
+                records = []
+                offset = self.read_offset
+                total = 0
+                # Map stored wall-clock times back onto the monotonic clock
+                clock_offset = time.monotonic() - time.time()
+                with open(self._path(seq), "rb") as f:
+                    f.seek(offset)
+                    while offset < end and total < max_bytes and len(records) < max_count:
+                        header = f.read(self.FRAME.size)
+                        if len(header) < self.FRAME.size:
+                            break
+                        length, timestamp = self.FRAME.unpack(header)
+                        data = f.read(length)
+                        if len(data) < length:
+                            break
+                        records.append(AISRecord(data, timestamp + clock_offset, timestamp))
+                        offset += self.FRAME.size + length
+                        total += length
+                
+                if not records:
+                    if writing:
+                        return []
+                    # Torn write from an unclean shutdown
+                    logging.warning(f"Discarding truncated spool segment {self._path(seq)}")
+                    self._remove_oldest()
+                    continue
+                
+                self.pending = (seq, offset)
+                return records
+            return []
+    
+    def ack(self) -> None:
+        """Mark the records returned by the last read_batch() as delivered."""
+        with self.lock:
+            if self.pending is None:
+                return
+            seq, offset = self.pending
+            self.pending = None
+            # The segment may have been discarded while the batch was in flight
+            if not self.segments or self.segments[0] != seq:
+                return
+            
+            self.size -= offset - self.read_offset
+            self.read_offset = offset
+            writing = self.writer is not None and seq == self.segments[-1]
+            if offset >= self.sizes[seq] and not writing:
+                self._remove_oldest()
+            if self.size == 0:
+                self.not_empty.clear()
+    
+    def sync(self) -> None:
+        """Flush appended data to disk if the fsync interval has elapsed."""
+        with self.lock:
+            self._sync_if_due()
+    
+    def close(self) -> None:
+        """Flush and close the active segment."""
+        with self.lock:
+            if self.writer:
+                try:
+                    os.fsync(self.writer.fileno())
+                    self.writer.close()
+                except OSError as e:
+                    logging.warning(f"Error closing spool segment: {e}")
+                finally:
+                    self.writer = None
+    
+    def _sync_if_due(self) -> None:
+        """fsync the active segment at most once per fsync_interval."""
+        if not self.unsynced or self.writer is None:
+            return
+        now = time.monotonic()
+        if now - self.last_fsync >= self.fsync_interval:
+            os.fsync(self.writer.fileno())
+            self.unsynced = False
+            self.last_fsync = now
+    
+    def _enforce_budget(self) -> None:
+        """Discard the oldest segments while over max_bytes, unless a compaction may free room. Hold lock."""
+        while self.compacting is None and self.size > self.max_bytes and len(self.segments) > 1:
+            dropped = self.sizes[self.segments[0]] - self.read_offset
+            self._remove_oldest()
+            logging.warning(f"Spool over {self.max_bytes} bytes, discarded {dropped} oldest bytes")
+    
+    def _frames(self, segments: List[int], offset: int) -> Iterator[Tuple[Tuple[int, int], bytes, bytes]]:
+        """
+        Yield the framed records of segments, starting at offset in the first.
+        
+        Yields:
+            Tuple of the record's (segment, offset) position, the raw frame
+            (header and data) and the data
+        """
+        for seq in segments:
+            with open(self._path(seq), "rb") as f:
+                f.seek(offset)
+                while True:
+                    header = f.read(self.FRAME.size)
+                    if len(header) < self.FRAME.size:
+                        break
+                    length, _ = self.FRAME.unpack(header)
+                    data = f.read(length)
+                    if len(data) < length:
+                        break
+                    yield (seq, offset), header + data, data
+                    offset += self.FRAME.size + length
+            offset = 0
+    
+    def _start_compaction(self) -> None:
+        """Seal the active segment and compact everything unread up to it in the background. Hold lock."""
+        self._rotate()
+        self.compacting = self.segments[:-1]
+        self.growth = 0
+        threading.Thread(
+            target=self._compact,
+            args=(self.compacting, self.read_offset),
+            name=f"AIS-Spool-Compact-{os.path.basename(self.directory)}",
+            daemon=True
+        ).start()
+    
+    def _compact(self, sealed: List[int], offset: int) -> None:
+        """
+        Rewrite sealed segments without superseded vessel reports.
+        
+        Two passes keep memory use to one entry per vessel and slot: the
+        first finds the newest report of each, the second copies the
+        survivors to compacted files that reuse the sealed segments' numbers,
+        so they keep their place ahead of segments appended meanwhile. Runs
+        without the lock; the result is swapped in by _finish_compaction().
+        
+        Args:
+            sealed: Segments to compact, oldest first
+            offset: Read offset in the first segment when compaction started
+        """
+        targets: List[int] = []
+        sizes: Dict[int, int] = {}
+        # (source position, compacted position) pairs to resume reading from
+        checkpoints: List[Tuple[Tuple[int, int], Tuple[int, int]]] = []
+        kept = dropped = 0
+        writer = None
+        try:
+            latest = {}
+            for index, (_, _, data) in enumerate(self._frames(sealed, offset)):
+                slot = vessel_slot(data)
+                if slot is not None:
+                    latest[slot] = index
+            
+            for index, (position, frame, data) in enumerate(self._frames(sealed, offset)):
+                slot = vessel_slot(data)
+                if slot is not None and latest[slot] != index:
+                    dropped += 1
+                    continue
+                if writer is None or (sizes[targets[-1]] >= self.segment_bytes and len(targets) < len(sealed)):
+                    if writer:
+                        os.fsync(writer.fileno())
+                        writer.close()
+                    targets.append(sealed[len(targets)])
+                    writer = open(self._path(targets[-1], self.COMPACT_SUFFIX), "wb")
+                    sizes[targets[-1]] = 0
+                    checkpoints.append((position, (targets[-1], 0)))
+                elif kept % COMPACT_CHECKPOINT == 0:
+                    checkpoints.append((position, (targets[-1], sizes[targets[-1]])))
+                writer.write(frame)
+                sizes[targets[-1]] += len(frame)
+                kept += 1
+            if writer:
+                os.fsync(writer.fileno())
+                writer.close()
+        except OSError as e:
+            logging.warning(f"Error compacting spool {self.directory}: {e}")
+            if writer:
+                writer.close()
+            for seq in targets:
+                try:
+                    os.remove(self._path(seq, self.COMPACT_SUFFIX))
+                except OSError:
+                    pass
+            targets = []
+            dropped = 0
+        
+        with self.lock:
+            self._finish_compaction(sealed, targets, sizes, checkpoints, kept, dropped)
+    
+    def _finish_compaction(self, sealed: List[int], targets: List[int], sizes: Dict[int, int],
+                           checkpoints: List[Tuple[Tuple[int, int], Tuple[int, int]]],
+                           kept: int, dropped: int) -> None:
+        """
+        Replace the sealed segments that are still unread with their compacted copies.
+        
+        Reading resumes at the last checkpoint before the position reached
+        meanwhile. Hold lock.
+        """
+        self.compacting = None
+        unread = [seq for seq in self.segments if seq in sealed]
+        newer = self.segments[len(unread):]
+        
+        resume = None
+        if targets and unread:
+            resume = (targets[0], 0)
+            reading = (self.segments[0], self.read_offset)
+            for source, compacted in checkpoints:
+                if source > reading:
+                    break
+                resume = compacted
+        replaced = targets[targets.index(resume[0]):] if resume else []
+        
+        for seq in sealed:
+            try:
+                if seq in replaced:
+                    os.replace(self._path(seq, self.COMPACT_SUFFIX), self._path(seq))
+                    continue
+                if seq in targets:
+                    os.remove(self._path(seq, self.COMPACT_SUFFIX))
+                # Unread segments stay if there is no compacted copy to read instead
+                if resume or seq not in unread:
+                    os.remove(self._path(seq))
+            except OSError as e:
+                logging.warning(f"Error replacing spool segment {seq}: {e}")
+        
+        if resume:
+            before = self.size
+            for seq in unread:
+                del self.sizes[seq]
+            self.sizes.update((seq, sizes[seq]) for seq in replaced)
+            self.segments = replaced + newer
+            self.read_offset = resume[1]
+            self.pending = None
+            self.size = sum(self.sizes.values()) - self.read_offset
+            self.compacted += dropped
+            logging.info(f"Compacted spool {self.directory} from {before} to {self.size} bytes, "
+                         f"dropping {dropped} superseded of {kept + dropped} sentences")
+            if self.size == 0:
+                self.not_empty.clear()
+        self._enforce_budget()
+    
+    def _rotate(self) -> None:
+        """Close the active segment and start a new one."""
+        if self.writer:
+            os.fsync(self.writer.fileno())
+            self.writer.close()
+            self.unsynced = False
+        seq = self.segments[-1] + 1 if self.segments else 0
+        self.writer = open(self._path(seq), "ab")
+        self.segments.append(seq)
+        self.sizes[seq] = 0
+    
+    def _remove_oldest(self) -> None:
+        """Delete the oldest segment and account for its unread bytes."""
+        seq = self.segments.pop(0)
+        self.size -= self.sizes.pop(seq) - self.read_offset
+        self.read_offset = 0
+        if self.pending and self.pending[0] == seq:
+            self.pending = None
+        # A segment still being compacted is deleted when the compaction is done
+        if not (self.compacting and seq in self.compacting):
+            try:
+                os.remove(self._path(seq))
+            except OSError as e:
+                logging.warning(f"Error removing spool segment {seq}: {e}")
+        if self.size == 0:
+            self.not_empty.clear()
+
+
+class LineSplitter:
+    """
+    Splits a byte stream into NMEA lines.
+    
+    Accepts CR LF, LF and bare CR line endings, carries a partial line over
+    to the next feed and returns every line terminated with CR LF. Empty
+    lines are dropped.
+    """
+    
+    def __init__(self, max_line_length: int = MAX_LINE_LENGTH):
+        self.max_line_length = max_line_length
+        self.buffer = bytearray()
+    
+    def feed(self, data: bytes) -> List[bytes]:
+        """
+        Add received bytes and return the lines they complete.
+        
+        Args:
+            data: Bytes read from the input
+            
+        Returns:
+            List of complete lines, each ending in CR LF
+        """
+        buffer = self.buffer
+        buffer += data
+        if not buffer:
+            return []
+        
+        lines = bytes(buffer).splitlines()
+        if buffer[-1] in b"\r\n":
+            buffer.clear()
+        else:
+            partial = lines.pop()
+            if len(partial) > self.max_line_length:
+                logging.warning(f"Discarding {len(partial)} bytes without a line ending")
+                buffer.clear()
+            else:
+                del buffer[:len(buffer) - len(partial)]
+        return [line + b"\r\n" for line in lines if line]
+    
+    def flush(self) -> List[bytes]:
+        """Return a pending partial line as a complete line, e.g. at the end of a datagram."""
+        if not self.buffer:
+            return []
+        line = bytes(self.buffer) + b"\r\n"
+        self.buffer.clear()
+        return [line]
+    
+    def clear(self) -> None:
+        """Discard any partial line, e.g. after the input was reopened."""
+        self.buffer.clear()
+
+
+class FragmentAssembler:
+    """
+    Reassembles multi-part !AIVDM/!AIVDO messages.
+    
+    Fragments are collected per (channel, sequence id) until the group is
+    complete, then returned as one CR LF separated block so the whole
+    message is queued, sent or dropped as a unit. Incomplete groups are
+    evicted after a timeout or when more than max_groups are pending.
+    Other sentences pass straight through. Sequence ids are only unique
+    within one stream, so each TCP client or UDP sender needs its own
+    assembler.
+    """
+    
+    def __init__(self, timeout: float = FRAGMENT_TIMEOUT, max_groups: int = MAX_FRAGMENT_GROUPS,
+                 stats: Optional[Counter] = None):
+        self.timeout = timeout
+        self.max_groups = max_groups
+        # (channel, sequence id) -> (first fragment time, fragment count, fragments);
+        # insertion order is arrival order, so the oldest group is first
+        self.groups: Dict[Tuple[bytes, bytes], Tuple[float, int, List[bytes]]] = {}
+        # Shared by the assemblers of one input
+        self.stats = stats if stats is not None else Counter()
+    
+    def add(self, line: bytes, now: float) -> Optional[bytes]:
+        """
+        Add a received line.
+        
+        Args:
+            line: CR LF terminated sentence, optionally starting with a TAG block
+            now: time.monotonic() at read time
+            
+        Returns:
+            The line itself, the completed group, or None while a group is incomplete
+        """
+        self._expire(now)
+        
+        start = line.find(b"\\", 1) + 1 if line.startswith(b"\\") else 0
+        if line[start + 3:start + 6] not in (b"VDM", b"VDO"):
+            return line
+        fields = line[start:].split(b",", 5)
+        try:
+            count = int(fields[1])
+            number = int(fields[2])
+        except (IndexError, ValueError):
+            return line
+        if count <= 1:
+            return line
+        
+        key = (fields[4], fields[3])
+        group = self.groups.get(key)
+        if number == 1:
+            if group:
+                self._drop(key, self.groups.pop(key))
+            group = self.groups[key] = (now, count, [line])
+        elif group and group[1] == count and number == len(group[2]) + 1:
+            group[2].append(line)
+        else:
+            # Out of order, or the group's first fragment was never seen
+            if group:
+                self._drop(key, self.groups.pop(key))
+            self.stats["fragments_dropped"] += 1
+            return None
+        
+        if len(group[2]) == count:
+            del self.groups[key]
+            return b"".join(group[2])
+        
+        if len(self.groups) > self.max_groups:
+            oldest = next(iter(self.groups))
+            self._drop(oldest, self.groups.pop(oldest))
+        return None
+    
+    def clear(self) -> None:
+        """Discard incomplete groups, e.g. after the stream was closed."""
+        while self.groups:
+            key = next(iter(self.groups))
+            self._drop(key, self.groups.pop(key))
+    
+    def _expire(self, now: float) -> None:
+        """Drop groups that have waited longer than the timeout."""
+        while self.groups:
+            key = next(iter(self.groups))
+            if now - self.groups[key][0] < self.timeout:
+                break
+            self._drop(key, self.groups.pop(key))
+    
+    def _drop(self, key: Tuple[bytes, bytes], group: Tuple[float, int, List[bytes]]) -> None:
+        """Count the fragments of an abandoned group."""
+        self.stats["fragments_dropped"] += len(group[2])
+        logging.debug(f"Dropping incomplete {group[1]}-part message (channel {key[0]}, id {key[1]})")
+
+
+class RecordBuffer:
+    """
+    Bounded FIFO of records whose capacity is set in bytes.
+    
+    put() never blocks, so a reader handing records to a slow output is never
+    held up. When a record does not fit, the overflow policy either discards
+    the oldest records until it does (drop_oldest, keeping the newest data)
+    or discards the new record (drop_newest). The lock only covers a deque
+    operation and the byte count.
+    
+    With compact set, a full buffer is first compacted (see
+    compact_records()), at most once per COMPACT_MIN_GROWTH of max_bytes
+    appended, and the overflow policy only applies if that is not enough.
+    """
+    
+    def __init__(self, name: str, max_bytes: int = QUEUE_MAX_BYTES, policy: str = "drop_oldest",
+                 compact: bool = False):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.compact = compact
+        self.records: deque = deque()
+        self.size = 0
+        self.dropped = 0
+        self.compacted = 0
+        # Bytes appended since the last compaction
+        self.growth = 0
+        self.lock = threading.Lock()
+        self.not_empty = threading.Condition(self.lock)
+        self.dropped_reported = 0
+        self.dropped_reported_at = time.monotonic()
+    
+    def qsize(self) -> int:
+        """Return the number of queued records."""
+        return len(self.records)
+    
+    def empty(self) -> bool:
+        """Return True if nothing is queued."""
+        return not self.records
+    
+    def put(self, record: AISRecord) -> bool:
+        """
+        Queue a record, discarding data per the overflow policy if it does not fit.
+        
+        Args:
+            record: Record to queue
+        
+        Returns:
+            bool: True if queued, False if the record itself was discarded
+        """
+        size = len(record.data)
+        evicted = 0
+        with self.lock:
+            fits = self.size + size <= self.max_bytes
+            if not fits and self.compact and self.growth >= self.max_bytes * COMPACT_MIN_GROWTH:
+                self._compact()
+                fits = self.size + size <= self.max_bytes
+            if not fits and self.policy == "drop_oldest" and size <= self.max_bytes:
+                while self.size + size > self.max_bytes:
+                    self.size -= len(self.records.popleft().data)
+                    evicted += 1
+                fits = True
+            if fits:
+                self.records.append(record)
+                self.size += size
+                self.growth += size
+                self.not_empty.notify()
+        if not fits:
+            self._count_dropped(1)
+        elif evicted:
+            self._count_dropped(evicted)
+        return fits
+    
+    def get_nowait(self) -> Optional[AISRecord]:
+        """Remove and return the oldest record, or None if nothing is queued."""
+        with self.lock:
+            if not self.records:
+                return None
+            record = self.records.popleft()
+            self.size -= len(record.data)
+            return record
+    
+    def get(self, timeout: float) -> Optional[AISRecord]:
+        """
+        Remove and return the oldest record, waiting for one if necessary.
+        
+        Only for threads; the asyncio engine uses get_nowait().
+        
+        Args:
+            timeout: Seconds to wait
+        
+        Returns:
+            The record, or None if nothing arrived in time
+        """
+        with self.not_empty:
+            if not self.not_empty.wait_for(lambda: self.records, timeout):
+                return None
+            record = self.records.popleft()
+            self.size -= len(record.data)
+            return record
+    
+    def get_batch(self, max_count: int, max_bytes: int) -> List[AISRecord]:
+        """Remove and return up to max_count of the oldest records, stopping after max_bytes."""
+        batch = []
+        size = 0
+        with self.lock:
+            while self.records and len(batch) < max_count and size < max_bytes:
+                record = self.records.popleft()
+                self.size -= len(record.data)
+                size += len(record.data)
+                batch.append(record)
+        return batch
+    
+    def requeue(self, records: List[AISRecord]) -> None:
+        """Put records taken by get_batch() back at the head, ahead of newer ones."""
+        with self.lock:
+            self.records.extendleft(reversed(records))
+            self.size += sum(len(record.data) for record in records)
+    
+    def take_all(self) -> List[AISRecord]:
+        """Remove and return everything queued."""
+        with self.lock:
+            records = list(self.records)
+            self.records.clear()
+            self.size = 0
+        return records
+    
+    def _compact(self) -> None:
+        """Drop superseded vessel reports. Hold lock."""
+        records = compact_records(list(self.records))
+        self.compacted += len(self.records) - len(records)
+        self.records = deque(records)
+        self.size = sum(len(record.data) for record in records)
+        self.growth = 0
+    
+    def _count_dropped(self, dropped: int) -> None:
+        """Count discarded records and report them at most once per OVERFLOW_LOG_INTERVAL."""
+        self.dropped += dropped
+        now = time.monotonic()
+        if now - self.dropped_reported_at >= OVERFLOW_LOG_INTERVAL or not self.dropped_reported:
+            side = "oldest" if self.policy == "drop_oldest" else "newest"
+            logging.warning(f"Queue for {self.name} full, dropped {self.dropped - self.dropped_reported} "
+                            f"{side} sentences ({self.dropped} in total)")
+            self.dropped_reported = self.dropped
+            self.dropped_reported_at = now
+
+
+class BacklogPacer:
+    """
+    Decides when backlog may be sent around live data.
+    
+    While live data is waiting, backlog may make up at most share of the
+    sentences sent, paid for with credit earned by live sends. The backlog is
+    also held to rate sentences per second (0 for no limit) by a token
+    bucket; a batch may overdraw it, and the debt is repaid before the next.
+    """
+    
+    def __init__(self, share: float = BACKLOG_SHARE, rate: int = 0, burst: int = BATCH_MAX_COUNT):
+        self.share = share
+        self.rate = rate
+        self.burst = burst
+        self.credit = 0.0
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+    
+    def live_sent(self, count: int) -> None:
+        """Earn backlog credit for live sentences sent."""
+        if self.share < 1:
+            self.credit = min(self.credit + count * self.share / (1 - self.share), self.burst)
+    
+    def allowance(self, live_waiting: bool) -> int:
+        """
+        Return how many backlog sentences may be sent now.
+        
+        Args:
+            live_waiting: True if live data is queued behind the backlog batch
+        """
+        allowance = float(self.burst)
+        if self.rate:
+            now = time.monotonic()
+            self.tokens = min(self.tokens + (now - self.updated) * self.rate, self.burst)
+            self.updated = now
+            allowance = min(allowance, self.tokens)
+        if live_waiting and self.share < 1:
+            allowance = min(allowance, self.credit)
+        return int(allowance)
+    
+    def backlog_sent(self, count: int) -> None:
+        """Pay for backlog sentences sent."""
+        self.tokens -= count
+        self.credit = max(self.credit - count, 0.0)
+    
+    def delay(self) -> float:
+        """Return the seconds until the rate limit allows another backlog sentence."""
+        if not self.rate or self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class OutputSinkBase:
+    """
+    Base class for the output sinks of both engines.
+    
+    Holds an output's queue, filters, spool and live-first backlog, and does
+    the engine-independent work: expiring old records, accounting for sends,
+    and deciding what goes out live and what is backfilled when. Subclasses
+    own the connection and implement sending and waiting on threads or on
+    the event loop.
+    """
+    
+    def __init__(self, config: OutputConfig, vessel_cache: Optional[VesselCache] = None):
+        self.config = config
+        self.name = f"{config.name} ({config.protocol} {config.ip}:{config.port})"
+        self.data_queue = RecordBuffer(self.name, config.queue_max_bytes, config.overflow_policy, config.compact)
+        self.spool = None
+        if config.spool_dir:
+            self.spool = DiskSpool(
+                config.spool_dir,
+                config.spool_max_bytes,
+                config.spool_segment_bytes,
+                config.spool_fsync_interval,
+                config.compact
+            )
+        # Head-of-line slot for a batch that failed to send
+        self.retry_batch: List[AISRecord] = []
+        self.stats = Counter()
+        self.last_latency = 0.0
+        self.message_filter = MessageFilter.from_config(config)
+        self.downsampler = Downsampler.from_config(config)
+        self.vessel_cache = vessel_cache
+        self.pacer = BacklogPacer(config.backlog_share, config.backlog_rate, config.batch_max_count)
+        # Live-first outputs without a spool keep their backlog in memory
+        self.backlog = None
+        if config.live_first and not self.spool:
+            self.backlog = RecordBuffer(
+                f"{self.name} backlog",
+                config.queue_max_bytes,
+                config.overflow_policy,
+                config.compact
+            )
+    
+    @property
+    def connected(self) -> bool:
+        """True if the sink can currently send."""
+        raise NotImplementedError
+    
+    def offer(self, record: AISRecord) -> bool:
+        """
+        Queue a record for this sink without blocking.
+        
+        Args:
+            record: Record to forward; the same object is shared by all sinks
+        
+        Returns:
+            bool: True if queued, False if the record was filtered out, thinned
+                or the queue was full and the overflow policy dropped it
+        """
+        if self.message_filter and not self.message_filter.accepts(record.data):
+            self.stats["filtered"] += 1
+            return False
+        if self.downsampler and not self.downsampler.accepts(record):
+            self.stats["thinned"] += 1
+            return False
+        if not self.data_queue.put(record):
+            return False
+        if self.downsampler:
+            # A report the queue dropped must not hold back the next one
+            self.downsampler.mark_sent(record)
+        return True
+    
+    def status(self) -> Dict[str, Union[str, int, float, bool]]:
+        """Return counters and state for monitoring."""
+        status = {
+            "name": self.config.name,
+            "protocol": self.config.protocol,
+            "destination": f"{self.config.ip}:{self.config.port}",
+            "connected": self.connected,
+            "queued": self.data_queue.qsize(),
+            "queued_bytes": self.data_queue.size,
+            "dropped": self.data_queue.dropped,
+            "compacted": self.data_queue.compacted,
+            "retry": len(self.retry_batch),
+            "latency_ms": round(self.last_latency * 1000, 1),
+        }
+        if self.spool:
+            status["spooled_bytes"] = self.spool.size
+            status["compacted"] += self.spool.compacted
+        if self.backlog:
+            status["backlog"] = self.backlog.qsize()
+            status["compacted"] += self.backlog.compacted
+        status.update(self.stats)
+        return status
+    
+    def _sent(self, batch: List[AISRecord], backlog: bool = False) -> None:
+        """
+        Account for a batch that was sent.
+        
+        Args:
+            batch: Records sent, in order
+            backlog: True for backfilled data, which does not count towards latency
+        """
+        if not backlog:
+            # Receive-to-send latency of the oldest record in the batch
+            self.last_latency = time.monotonic() - batch[0].received
+        self.stats["sent"] += len(batch)
+        logging.debug(f"Sent {len(batch)} sentences to {self.name} ({self.last_latency * 1000:.1f} ms after receipt)")
+    
+    def _expire(self, batch: List[AISRecord], count: bool = True) -> List[AISRecord]:
+        """
+        Drop records received more than max_age seconds ago.
+        
+        Args:
+            batch: Records to check
+            count: False if the caller counts the dropped records itself,
+                once they are gone for good
+        
+        Returns:
+            The records that are still fresh, in order
+        """
+        if not self.config.max_age or not batch:
+            return batch
+        cutoff = time.monotonic() - self.config.max_age
+        fresh = [record for record in batch if record.received >= cutoff]
+        if count and len(fresh) < len(batch):
+            self.stats["expired"] += len(batch) - len(fresh)
+        return fresh
+    
+    def _ack_spool(self, batch: List[AISRecord], fresh: List[AISRecord]) -> None:
+        """Consume the records of the last spool read, counting those that had expired."""
+        self.spool.ack()
+        if len(fresh) < len(batch):
+            self.stats["expired"] += len(batch) - len(fresh)
+    
+    def _backlog_pending(self) -> bool:
+        """Return True if the spool or the in-memory backlog holds data."""
+        if self.spool:
+            return not self.spool.is_empty()
+        return not self.backlog.empty()
+    
+    def _add_backlog(self, records: List[AISRecord]) -> None:
+        """Hand records to the spool or the in-memory backlog."""
+        if self.spool:
+            self.spool.append(records)
+            self.stats["spooled"] += len(records)
+            return
+        for record in records:
+            self.backlog.put(record)
+    
+    def _split_live(self, batch: List[AISRecord]) -> List[AISRecord]:
+        """Move the records of a batch older than live_window to the backlog and return the rest."""
+        cutoff = time.monotonic() - self.config.live_window
+        live = [record for record in batch if record.received >= cutoff]
+        if len(live) < len(batch):
+            self._add_backlog([record for record in batch if record.received < cutoff])
+        return live
+    
+    def _live_done(self, live: List[AISRecord], sent: bool) -> None:
+        """Earn backlog credit for sent live records, or move unsent ones to the backlog."""
+        if sent:
+            self.pacer.live_sent(len(live))
+        else:
+            self._add_backlog(live)
+    
+    def _next_backfill(self) -> Optional[Tuple[List[AISRecord], List[AISRecord]]]:
+        """
+        Take the next backlog batch if the endpoint is up and the pacer allows it.
+        
+        Returns:
+            The batch read and its records that have not expired, or None if
+            nothing may be sent now
+        """
+        if not self.connected or not self._backlog_pending():
+            return None
+        allowance = self.pacer.allowance(live_waiting=not self.data_queue.empty())
+        if allowance <= 0:
+            return None
+        
+        if self.spool:
+            batch = self.spool.read_batch(allowance, self.config.batch_max_bytes)
+        else:
+            batch = self.backlog.get_batch(allowance, self.config.batch_max_bytes)
+        if not batch:
+            return None
+        return batch, self._expire(batch, count=not self.spool)
+    
+    def _backfill_done(self, batch: List[AISRecord], fresh: List[AISRecord], sent: bool) -> None:
+        """
+        Settle a backlog batch from _next_backfill().
+        
+        Args:
+            batch: Records read from the backlog
+            fresh: The records that were sent
+            sent: False if sending failed and the records must be kept
+        """
+        if not sent:
+            if self.backlog:
+                self.backlog.requeue(fresh)
+            return
+        
+        if self.spool:
+            self._ack_spool(batch, fresh)
+        if fresh:
+            self.pacer.backlog_sent(len(fresh))
+            self.stats["backfilled"] += len(fresh)
+
+
+class OutputSink(OutputSinkBase):
+    """
+    One forwarding destination with its own queue, consumer and socket.
+    
+    Each sink is independent, so a slow or unreachable endpoint only fills
+    its own queue and never stalls the producer or the other sinks.
+    """
+    
+    def __init__(self, config: OutputConfig, vessel_cache: Optional[VesselCache] = None):
+        super().__init__(config, vessel_cache)
+        if config.protocol == "udp":
+            self.socket_manager = UDPSender(
+                config.ip,
+                config.port,
+                config.mtu,
+                config.multicast_ttl,
+                config.broadcast
+            )
+        elif config.protocol == "tcp_server":
+            self.socket_manager = TCPServerSender(config.ip, config.port, config.client_buffer)
+        else:
+            self.socket_manager = SocketManager(
+                config.ip,
+                config.port,
+                config.max_retries
+            )
+        self.running = False
+        self.consumer_thread = None
+        self.spool_thread = None
+        self.snapshot_generation = 0
+        if config.snapshot_on_connect and vessel_cache is not None:
+            self.socket_manager.on_connect = self._start_snapshot
+    
+    @property
+    def connected(self) -> bool:
+        """True if the sink can currently send."""
+        return self.socket_manager.connected
+    
+    def status(self) -> Dict[str, Union[str, int, float, bool]]:
+        """Return counters and state for monitoring."""
+        status = super().status()
+        if isinstance(self.socket_manager, TCPServerSender):
+            status["clients"] = len(self.socket_manager.clients)
+            status["evicted"] = self.socket_manager.evicted
+        return status
+    
+    def _send(self, batch: List[AISRecord], backlog: bool = False) -> bool:
+        """
+        Render a batch and send it with one write.
+        
+        Args:
+            batch: Records to send, in order
+            backlog: True for backfilled data, which does not count towards latency
+        
+        Returns:
+            bool: True if the batch was sent, False otherwise
+        """
+        buffers = render_records(batch, self.config.tag_timestamp)
+        if len(buffers) == 1:
+            sent = self.socket_manager.send(buffers[0])
+        else:
+            sent = self.socket_manager.send_batch(buffers)
+        
+        if sent:
+            self._sent(batch, backlog)
+        return sent
+
+    def _consumer(self) -> None:
+        """Process data from the queue and send it to the endpoint."""
+        while self.running:
+            try:
+                retrying = bool(self.retry_batch)
+                if retrying:
+                    # Data keeps queueing while we wait for the connector
+                    if not self.socket_manager.wait_connected(timeout=RETRY_DELAY):
+                        continue
+                    # Resend the failed batch before anything newer
+                    batch, self.retry_batch = self._expire(self.retry_batch), []
+                    if not batch:
+                        continue
+                else:
+                    batch = self._collect_batch()
+                    if not batch:
+                        continue
+                
+                if self.spool and not self.spool.is_empty():
+                    # Keep delivery order: older data is still in the spool
+                    self.spool.append(batch)
+                    self.stats["spooled"] += len(batch)
+                    continue
+                
+                if self._send(batch):
+                    continue
+                
+                if self.spool:
+                    logging.warning(f"Failed to send {len(batch)} sentences to {self.name}, spooling to disk")
+                    self.spool.append(batch)
+                    self.stats["spooled"] += len(batch)
+                else:
+                    if not retrying:
+                        logging.warning(f"Failed to send {len(batch)} sentences to {self.name}, holding for retry")
+                    self.retry_batch = batch
+            except Exception as e:
+                logging.error(f"Unexpected error in consumer for {self.name}: {e}")
+                time.sleep(1)
+    
+    def _live_first_consumer(self) -> None:
+        """
+        Send live data as soon as it arrives and backfill older data around it.
+        
+        Records older than live_window, batches that failed to send and the
+        spool form the backlog, which is sent whenever the pacer allows.
+        """
+        while self.running:
+            try:
+                timeout = 1.0
+                if self.connected and self._backlog_pending():
+                    timeout = min(self.pacer.delay(), timeout)
+                batch = self._collect_batch(timeout)
+                if batch:
+                    self._send_live(batch)
+                self._backfill()
+                if self.spool:
+                    self.spool.sync()
+            except Exception as e:
+                logging.error(f"Unexpected error in consumer for {self.name}: {e}")
+                time.sleep(1)
+    
+    def _send_live(self, batch: List[AISRecord]) -> None:
+        """Send the live part of a batch, moving stale and unsent records to the backlog."""
+        live = self._split_live(batch)
+        if live:
+            self._live_done(live, self._send(live))
+    
+    def _backfill(self) -> None:
+        """Send one backlog batch if the endpoint is up and the pacer allows it."""
+        backfill = self._next_backfill()
+        if backfill:
+            batch, fresh = backfill
+            self._backfill_done(batch, fresh, not fresh or self._send(fresh, backlog=True))
+    
+    def _start_snapshot(self, client: Optional[socket.socket] = None) -> None:
+        """
+        Send the vessel cache to a new connection in the background.
+        
+        Args:
+            client: Client socket of a server output, None for the endpoint
+                of a TCP output
+        """
+        if client is None:
+            self.snapshot_generation += 1
+        threading.Thread(
+            target=self._send_snapshot,
+            args=(self.snapshot_generation, client),
+            name=f"AIS-Snapshot-{self.config.name}",
+            daemon=True
+        ).start()
+    
+    def _send_snapshot(self, generation: int, client: Optional[socket.socket]) -> None:
+        """
+        Send cached records in small chunks, leaving room for live traffic.
+        
+        Args:
+            generation: Connection the snapshot is for; a reconnect abandons it
+            client: Client socket of a server output, None for the endpoint
+        """
+        records = self.vessel_cache.records(self.message_filter)
+        chunk_size = int(self.config.snapshot_rate * SNAPSHOT_INTERVAL)
+        for start in range(0, len(records), chunk_size):
+            if not self.running or generation != self.snapshot_generation:
+                return
+            buffers = render_records(records[start:start + chunk_size], self.config.tag_timestamp)
+            if client is None:
+                sent = self.socket_manager.send_batch(buffers)
+            else:
+                sent = self.socket_manager.send_to(client, buffers)
+            if not sent:
+                logging.warning(f"Snapshot to {self.name} interrupted")
+                return
+            self.stats["snapshot"] += len(buffers)
+            time.sleep(SNAPSHOT_INTERVAL)
+        if records:
+            logging.info(f"Sent snapshot of {len(records)} cached sentences to {self.name}")
+    
+    def _collect_batch(self, timeout: float = 1.0) -> List[AISRecord]:
+        """
+        Take the next data to send from the queue.
+        
+        Without batching this is a single item. With batching, blocks for the
+        first item and then keeps draining until a count or byte limit is hit
+        or batch_max_latency has passed since the first item arrived.
+        
+        Args:
+            timeout: Seconds to wait for the first item
+        
+        Returns:
+            List of queued records, empty if nothing arrived
+        """
+        record = self.data_queue.get(timeout=timeout)
+        if record is None:
+            return []
+        
+        batch = [record]
+        if not self.config.batch_enabled:
+            return self._expire(batch)
+        
+        size = len(record.data)
+        deadline = time.monotonic() + self.config.batch_max_latency
+        while len(batch) < self.config.batch_max_count and size < self.config.batch_max_bytes:
+            record = self.data_queue.get_nowait()
+            if record is None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                record = self.data_queue.get(timeout=remaining)
+                if record is None:
+                    break
+            batch.append(record)
+            size += len(record.data)
+        return self._expire(batch)
+    
+    def _spool_drainer(self) -> None:
+        """Replay spooled data in order once the endpoint is reachable again."""
+        while self.running:
+            try:
+                if not self.spool.wait(timeout=self.config.spool_fsync_interval):
+                    self.spool.sync()
+                    continue
+                
+                if not self.socket_manager.wait_connected(timeout=self.config.spool_fsync_interval):
+                    self.spool.sync()
+                    continue
+                
+                batch = self.spool.read_batch(self.config.batch_max_count, self.config.batch_max_bytes)
+                if not batch:
+                    time.sleep(self.config.spool_fsync_interval)
+                    continue
+                
+                fresh = self._expire(batch, count=False)
+                if not fresh or self._send(fresh):
+                    self._ack_spool(batch, fresh)
+                    logging.debug(f"Replayed {len(fresh)} spooled sentences to {self.name}")
+                self.spool.sync()
+            except Exception as e:
+                logging.error(f"Unexpected error in spool drainer for {self.name}: {e}")
+                time.sleep(1)
+    
+    def start(self) -> None:
+        """Start the consumer and spool threads."""
+        if self.running:
+            return
+        
+        self.running = True
+        self.socket_manager.start()
+        
+        self.consumer_thread = threading.Thread(
+            target=self._live_first_consumer if self.config.live_first else self._consumer,
+            name=f"AIS-Consumer-{self.config.name}",
+            daemon=True
+        )
+        self.consumer_thread.start()
+        
+        # Live-first consumers replay the spool themselves
+        if self.spool and not self.config.live_first:
+            self.spool_thread = threading.Thread(
+                target=self._spool_drainer,
+                name=f"AIS-Spool-{self.config.name}",
+                daemon=True
+            )
+            self.spool_thread.start()
+    
+    def stop(self) -> None:
+        """Stop the threads and close the connection."""
+        if not self.running:
+            return
+        
+        self.running = False
+        
+        if self.consumer_thread and self.consumer_thread.is_alive():
+            self.consumer_thread.join(timeout=5)
+        
+        if self.spool_thread and self.spool_thread.is_alive():
+            self.spool_thread.join(timeout=5)
+        
+        self.socket_manager.close()
+        if self.spool:
+            self.spool.close()
+
+
+class InputSource:
+    """
+    Base class for inputs feeding the shared pipeline.
+    
+    Splits received bytes into lines, optionally drops lines whose checksum
+    does not match, and passes each line, optionally tagged with an NMEA 4.0
+    s: (source) TAG parameter, to the dispatch callback as an AISRecord
+    stamped with the time it was read.
+    Subclasses implement _reader(), which runs in the input's thread.
+    """
+    
+    def __init__(self, config: InputConfig, dispatch: Callable[[AISRecord], None]):
+        self.config = config
+        self.dispatch = dispatch
+        self.stats = Counter()
+        self.splitter = LineSplitter()
+        self.assembler = self.new_assembler()
+        # UDP sender address -> its assembler, least recently heard first
+        self.sender_assemblers: Dict[Tuple[str, int], FragmentAssembler] = {}
+        self.running = False
+        self.stop_event = threading.Event()
+        self.producer_thread = None
+        self.tag_params = None
+        self.tag_prefix = None
+        if config.tag_source:
+            self.tag_params = f"s:{config.source or config.name}".encode("ascii")
+            # Built once; lines that carry their own TAG block are merged instead
+            self.tag_prefix = tag_block(self.tag_params)
+        self.invalid_reported = 0
+        self.invalid_reported_at = time.monotonic()
+    
+    @property
+    def description(self) -> str:
+        """Human-readable address of the input."""
+        return f"{self.config.type} {self.config.host or '0.0.0.0'}:{self.config.port}"
+    
+    def status(self) -> Dict[str, Union[str, int]]:
+        """Return counters for monitoring."""
+        status = {
+            "name": self.config.name,
+            "type": self.config.type,
+            "address": self.description,
+        }
+        if self.config.reassemble:
+            status["fragments_dropped"] = 0
+        status.update(self.stats)
+        return status
+    
+    def new_assembler(self) -> Optional[FragmentAssembler]:
+        """Return a fragment assembler for one stream, or None if reassembly is off."""
+        if not self.config.reassemble:
+            return None
+        return FragmentAssembler(self.config.fragment_timeout, stats=self.stats)
+    
+    def feed(self, data: bytes, splitter: Optional[LineSplitter] = None,
+             assembler: Optional[FragmentAssembler] = None) -> None:
+        """
+        Split received bytes into lines and dispatch the complete ones.
+        
+        Args:
+            data: Bytes received from the input
+            splitter: Splitter holding this stream's partial line, when one
+                input receives several streams (e.g. TCP server clients)
+            assembler: This stream's fragment assembler in the same case
+        """
+        self._emit((splitter or self.splitter).feed(data), assembler or self.assembler)
+    
+    def feed_datagram(self, data: bytes, sender: Optional[Tuple[str, int]] = None) -> None:
+        """
+        Dispatch every line in a datagram, including an unterminated last one.
+        
+        Args:
+            data: Datagram payload
+            sender: Address the datagram came from; fragments are only
+                reassembled with others from the same sender
+        """
+        assembler = None
+        if self.config.reassemble:
+            assembler = self.sender_assemblers.pop(sender, None) or self.new_assembler()
+        self._emit(self.splitter.feed(data) + self.splitter.flush(), assembler)
+        if assembler and assembler.groups:
+            # Reinserted last, so the least recently heard sender is first
+            self.sender_assemblers[sender] = assembler
+            if len(self.sender_assemblers) > MAX_FRAGMENT_SENDERS:
+                oldest = next(iter(self.sender_assemblers))
+                self.sender_assemblers.pop(oldest).clear()
+    
+    def _emit(self, lines: List[bytes], assembler: Optional[FragmentAssembler]) -> None:
+        """Stamp the lines of one read with its receive time, tag and dispatch them."""
+        if not lines:
+            return
+        received = time.monotonic()
+        timestamp = time.time()
+        self.stats["lines"] += len(lines)
+        for line in lines:
+            if self.config.validate_checksum and not nmea_checksum_valid(line):
+                self._reject(line, received)
+                continue
+            if self.tag_params:
+                if line.startswith(b"\\"):
+                    line = add_tag_params(line, self.tag_params)
+                else:
+                    line = self.tag_prefix + line
+            if assembler:
+                line = assembler.add(line, received)
+                if line is None:
+                    continue
+            self.dispatch(AISRecord(line, received, timestamp))
+    
+    def _reject(self, line: bytes, now: float) -> None:
+        """Count a line that failed validation and drop or quarantine it."""
+        self.stats["invalid"] += 1
+        logging.debug(f"Invalid checksum from {self.config.name}: {line}")
+        if self.config.invalid_action == "quarantine":
+            try:
+                with open(self.config.quarantine_file, "ab") as quarantine:
+                    quarantine.write(line)
+            except OSError as e:
+                logging.error(f"Error writing quarantine file {self.config.quarantine_file}: {e}")
+        
+        if now - self.invalid_reported_at >= INVALID_LOG_INTERVAL:
+            invalid = self.stats["invalid"] - self.invalid_reported
+            logging.warning(f"Input {self.config.name}: {invalid} lines failed checksum validation "
+                            f"in the last {now - self.invalid_reported_at:.0f}s "
+                            f"({self.stats['invalid']} of {self.stats['lines']} in total)")
+            self.invalid_reported = self.stats["invalid"]
+            self.invalid_reported_at = now
+    
+    def _reader(self) -> None:
+        """Read from the input until stopped."""
+        raise NotImplementedError
+    
+    def reset(self) -> None:
+        """Discard partial lines and messages, e.g. after the input reconnected."""
+        self.splitter.clear()
+        if self.assembler:
+            self.assembler.clear()
+        for assembler in self.sender_assemblers.values():
+            assembler.clear()
+        self.sender_assemblers.clear()
+    
+    def close(self) -> None:
+        """Release the input's resources."""
+        self.reset()
+    
+    def start(self) -> None:
+        """Start the producer thread."""
+        if self.running:
+            return
+        
+        self.running = True
+        self.stop_event.clear()
+        self.producer_thread = threading.Thread(
+            target=self._reader,
+            name=f"AIS-Producer-{self.config.name}",
+            daemon=True
+        )
+        self.producer_thread.start()
+    
+    def stop(self) -> None:
+        """Stop the producer thread and close the input."""
+        self.running = False
+        self.stop_event.set()
+        if self.producer_thread and self.producer_thread.is_alive():
+            self.producer_thread.join(timeout=5)
+        self.close()
+
+
+class SerialInput(InputSource):
+    """One serial port, read in chunks of whatever is available."""
+    
+    def __init__(self, config: InputConfig, dispatch: Callable[[AISRecord], None]):
+        super().__init__(config, dispatch)
+        self.serial_port = None
+    
+    @property
+    def description(self) -> str:
+        """Human-readable address of the input."""
+        return self.config.serial_port
+    
+    def read(self) -> None:
+        """
+        Read available data and dispatch every complete line.
+        
+        Raises:
+            serial.SerialException: If the port fails
+        """
+        # Read everything that is waiting (at least one byte, which blocks
+        # up to serial_timeout unless the port is non-blocking)
+        self.feed(self.serial_port.read(self.serial_port.in_waiting or 1))
+    
+    def _reader(self) -> None:
+        """Read data from the serial port until stopped."""
+        while self.running:
+            try:
+                if self.serial_port is None or not self.serial_port.is_open:
+                    self.connect()
+                    if self.serial_port is None:
+                        self.stop_event.wait(RECONNECT_DELAY)
+                        continue
+                
+                self.read()
+            except serial.SerialException as e:
+                logging.error(f"AIS serial read error on {self.config.serial_port}: {e}")
+                self.close()
+                self.stop_event.wait(RECONNECT_DELAY)
+            except Exception as e:
+                logging.error(f"Unexpected error in producer for {self.config.serial_port}: {e}")
+                time.sleep(1)
+    
+    def connect(self) -> None:
+        """Connect to the serial port."""
+        try:
+            self.serial_port = serial.Serial(
+                self.config.serial_port,
+                baudrate=self.config.baudrate,
+                timeout=self.config.serial_timeout
+            )
+            logging.info(f"Connected to AIS serial port: {self.config.serial_port}")
+        except serial.SerialException as e:
+            logging.error(f"Failed to connect to serial port {self.config.serial_port}: {e}")
+            self.serial_port = None
+    
+    def close(self) -> None:
+        """Close the serial port connection."""
+        if self.serial_port and self.serial_port.is_open:
+            try:
+                self.serial_port.close()
+            except Exception as e:
+                logging.warning(f"Error closing serial port: {e}")
+            finally:
+                self.serial_port = None
+        super().close()
+
+
+class TCPClientInput(InputSource):
+    """Reads NMEA from a remote TCP server, reconnecting with backoff."""
+    
+    def _reader(self) -> None:
+        """Connect, read until the connection drops, and repeat until stopped."""
+        backoff_delay = RECONNECT_DELAY
+        while self.running:
+            try:
+                sock = socket.create_connection((self.config.host, self.config.port), timeout=SOCKET_TIMEOUT)
+            except OSError as e:
+                logging.warning(f"Failed to connect to input {self.description}: {e}")
+                self.stop_event.wait(backoff_delay)
+                backoff_delay = min(backoff_delay * BACKOFF_FACTOR, MAX_BACKOFF_DELAY)
+                continue
+            
+            backoff_delay = RECONNECT_DELAY
+            logging.info(f"Connected to input {self.description}")
+            # Short timeout so stop() is noticed on a quiet connection
+            sock.settimeout(1)
+            try:
+                while self.running:
+                    try:
+                        data = sock.recv(RECV_SIZE)
+                    except socket.timeout:
+                        continue
+                    if not data:
+                        logging.warning(f"Input {self.description} closed the connection")
+                        break
+                    self.feed(data)
+            except OSError as e:
+                logging.warning(f"Error reading from input {self.description}: {e}")
+            finally:
+                sock.close()
+                self.reset()
+
+
+class TCPServerInput(InputSource):
+    """Accepts NMEA pushed by any number of TCP clients on a listening port."""
+    
+    def open_socket(self) -> socket.socket:
+        """Create the listening socket."""
+        server = socket.create_server((self.config.host, self.config.port))
+        server.setblocking(False)
+        return server
+    
+    def _reader(self) -> None:
+        """Accept clients and read from all of them until stopped."""
+        while self.running:
+            try:
+                server = self.open_socket()
+            except OSError as e:
+                logging.error(f"Failed to listen on {self.description}: {e}")
+                self.stop_event.wait(RECONNECT_DELAY)
+                continue
+            
+            logging.info(f"Listening for NMEA on {self.description}")
+            selector = selectors.DefaultSelector()
+            selector.register(server, selectors.EVENT_READ)
+            try:
+                while self.running:
+                    for key, _ in selector.select(timeout=1):
+                        if key.fileobj is server:
+                            self._accept(server, selector)
+                        else:
+                            self._read_client(key, selector)
+            except OSError as e:
+                logging.error(f"Error on input {self.description}: {e}")
+            finally:
+                for key in list(selector.get_map().values()):
+                    key.fileobj.close()
+                selector.close()
+    
+    def _accept(self, server: socket.socket, selector: selectors.BaseSelector) -> None:
+        """Accept a client and give it its own line splitter and fragment assembler."""
+        try:
+            conn, address = server.accept()
+        except BlockingIOError:
+            return
+        conn.setblocking(False)
+        selector.register(conn, selectors.EVENT_READ, (address, LineSplitter(), self.new_assembler()))
+        logging.info(f"Input {self.config.name}: client {address[0]}:{address[1]} connected")
+    
+    def _read_client(self, key: selectors.SelectorKey, selector: selectors.BaseSelector) -> None:
+        """Read from a client, dropping it on EOF or error."""
+        address, splitter, assembler = key.data
+        try:
+            data = key.fileobj.recv(RECV_SIZE)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            logging.warning(f"Input {self.config.name}: error reading from {address[0]}:{address[1]}: {e}")
+            data = b""
+        
+        if data:
+            self.feed(data, splitter, assembler)
+        else:
+            selector.unregister(key.fileobj)
+            key.fileobj.close()
+            if assembler:
+                assembler.clear()
+            logging.info(f"Input {self.config.name}: client {address[0]}:{address[1]} disconnected")
+
+
+class UDPInput(InputSource):
+    """Receives NMEA datagrams, joining the group for multicast addresses."""
+    
+    def open_socket(self) -> socket.socket:
+        """Create and bind the receiving socket."""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        host = self.config.host
+        if host and ipaddress.ip_address(host).is_multicast:
+            sock.bind(("", self.config.port))
+            membership = socket.inet_aton(host) + socket.inet_aton("0.0.0.0")
+            sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, membership)
+        else:
+            sock.bind((host, self.config.port))
+        return sock
+    
+    def _reader(self) -> None:
+        """Receive datagrams until stopped."""
+        while self.running:
+            try:
+                sock = self.open_socket()
+            except (OSError, ValueError) as e:
+                logging.error(f"Failed to listen on {self.description}: {e}")
+                self.stop_event.wait(RECONNECT_DELAY)
+                continue
+            
+            logging.info(f"Listening for NMEA on {self.description}")
+            sock.settimeout(1)
+            try:
+                while self.running:
+                    try:
+                        data, sender = sock.recvfrom(RECV_SIZE)
+                    except socket.timeout:
+                        continue
+                    self.feed_datagram(data, sender)
+            except OSError as e:
+                logging.error(f"Error on input {self.description}: {e}")
+            finally:
+                sock.close()
+
+
+INPUT_CLASSES = {
+    "serial": SerialInput,
+    "tcp_client": TCPClientInput,
+    "tcp_server": TCPServerInput,
+    "udp": UDPInput,
+}
+
+
+class AISHandler:
+    """
+    Handles AIS data processing with producer-consumer pattern.
+    
+    With admin_port set, an admin thread answers each connection with a
+    JSON status snapshot.
+    """
+    
+    engine = "threaded"
+    
+    def __init__(self, config: AISConfig):
+        self.config = config
+        self.inputs = [
+            INPUT_CLASSES[ais_input.type](ais_input, self._dispatch)
+            for ais_input in config.inputs
+        ]
+        self.vessel_cache = None
+        if config.vessel_cache:
+            self.vessel_cache = VesselCache(config.vessel_ttl, config.vessel_cache_size)
+        self.sinks = self._create_sinks()
+        self.running = False
+        self.started_at = None
+        self.admin_thread = None
+    
+    def status(self) -> Dict[str, Union[str, float, list, dict]]:
+        """Return the status snapshot served on the admin endpoint."""
+        status = {
+            "engine": self.engine,
+            "uptime": round(time.time() - self.started_at, 1),
+            "inputs": [ais_input.status() for ais_input in self.inputs],
+            "outputs": [sink.status() for sink in self.sinks],
+        }
+        if self.vessel_cache is not None:
+            status["vessel_cache"] = self.vessel_cache.status()
+        return status
+    
+    def _create_sinks(self) -> list:
+        """Create one sink per configured output."""
+        return [OutputSink(output, self.vessel_cache) for output in self.config.outputs]
+    
+    def _dispatch(self, record: AISRecord) -> None:
+        """Hand a received record to every sink."""
+        logging.debug(f"Received AIS data: {record.data}")
+        if self.vessel_cache is not None:
+            self.vessel_cache.update(record)
+        for sink in self.sinks:
+            sink.offer(record)
+    
+    def start(self) -> None:
+        """Start the producer threads and the output sinks."""
+        if self.running:
+            return
+        
+        self.running = True
+        self.started_at = time.time()
+        
+        # Start one consumer per output, then one producer per input
+        for sink in self.sinks:
+            sink.start()
+        
+        for ais_input in self.inputs:
+            ais_input.start()
+        
+        if self.config.admin_port:
+            self._start_admin()
+        
+        logging.info("AIS handler started")
+    
+    def _start_admin(self) -> None:
+        """Open the admin endpoint and start the thread answering it."""
+        try:
+            server = socket.create_server((self.config.admin_host, self.config.admin_port))
+        except OSError as e:
+            logging.error(f"Failed to open admin endpoint on {self.config.admin_host}:{self.config.admin_port}: {e}")
+            return
+        # Short timeout so stop() is noticed
+        server.settimeout(1)
+        self.admin_thread = threading.Thread(
+            target=self._serve_admin,
+            args=(server,),
+            name="AIS-Admin",
+            daemon=True
+        )
+        self.admin_thread.start()
+        logging.info(f"Admin endpoint listening on {self.config.admin_host}:{self.config.admin_port}")
+    
+    def _serve_admin(self, server: socket.socket) -> None:
+        """Write a JSON status snapshot to each admin client until stopped."""
+        with server:
+            while self.running:
+                try:
+                    conn, _ = server.accept()
+                except socket.timeout:
+                    continue
+                except OSError as e:
+                    logging.error(f"Error on admin endpoint: {e}")
+                    return
+                
+                with conn:
+                    try:
+                        conn.settimeout(SOCKET_TIMEOUT)
+                        conn.sendall(json.dumps(self.status()).encode() + b"\n")
+                    except OSError as e:
+                        logging.warning(f"Error writing admin status: {e}")
+                    except RuntimeError as e:
+                        # A counter was added by another thread while being copied
+                        logging.warning(f"Error reading status: {e}")
+    
+    def stop(self) -> None:
+        """Stop the AIS handler threads."""
+        if not self.running:
+            return
+        
+        logging.info("Stopping AIS handler...")
+        self.running = False
+        
+        # Wait for threads to terminate and close connections
+        for ais_input in self.inputs:
+            ais_input.stop()
+        
+        for sink in self.sinks:
+            sink.stop()
+        
+        if self.admin_thread and self.admin_thread.is_alive():
+            self.admin_thread.join(timeout=5)
+        
+        logging.info("AIS handler stopped")
+
+
+class AsyncOutputSink(OutputSinkBase):
+    """
+    Output sink driven by the asyncio engine.
+    
+    Provides the same queueing, batching, head-of-line retry and spooling as
+    OutputSink, but runs as a single task on the shared event loop instead of
+    in its own threads.
+    """
+    
+    def __init__(self, config: OutputConfig, vessel_cache: Optional[VesselCache] = None):
+        super().__init__(config, vessel_cache)
+        # Set by offer() to wake the sink task
+        self.data_ready: Optional[asyncio.Event] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        # Server outputs: the listening server and its connected clients
+        self.server: Optional[asyncio.AbstractServer] = None
+        self.clients: Dict[asyncio.StreamWriter, str] = {}
+        self.client_tasks: Set[asyncio.Task] = set()
+        self.udp_sender = None
+        if config.protocol == "udp":
+            self.udp_sender = UDPSender(
+                config.ip,
+                config.port,
+                config.mtu,
+                config.multicast_ttl,
+                config.broadcast
+            )
+        self.task: Optional[asyncio.Task] = None
+        self.last_attempt = 0
+        self.backoff_delay = RECONNECT_DELAY
+        self.snapshot_task: Optional[asyncio.Task] = None
+    
+    @property
+    def connected(self) -> bool:
+        """True if the sink can currently send."""
+        if self.udp_sender:
+            return self.udp_sender.connected
+        if self.config.protocol == "tcp_server":
+            return self.server is not None
+        return self.writer is not None and not self.writer.is_closing()
+    
+    def offer(self, record: AISRecord) -> bool:
+        """
+        Queue a record for this sink without blocking. Must be called on the loop.
+        
+        Args:
+            record: Record to forward; the same object is shared by all sinks
+        
+        Returns:
+            bool: True if queued, False if the record was filtered out, thinned
+                or the queue was full and the overflow policy dropped it
+        """
+        if not super().offer(record):
+            return False
+        self.data_ready.set()
+        return True
+    
+    def status(self) -> Dict[str, Union[str, int, float, bool]]:
+        """Return counters and state for the admin endpoint."""
+        status = super().status()
+        if self.config.protocol == "tcp_server":
+            status["clients"] = len(self.clients)
+        return status
+    
+    def start(self) -> None:
+        """Create the sink task. Must be called on the loop."""
+        self.data_ready = asyncio.Event()
+        self.task = asyncio.ensure_future(self._run_live_first() if self.config.live_first else self._run())
+    
+    async def stop(self) -> None:
+        """Cancel the sink tasks and close the connection."""
+        for task in (self.task, self.snapshot_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        self._close_writer()
+        if self.server:
+            self.server.close()
+            for writer in list(self.clients):
+                writer.close()
+            # Closing a client ends its handler once the loop sees the EOF
+            await asyncio.gather(*self.client_tasks, return_exceptions=True)
+            await self.server.wait_closed()
+            self.server = None
+        if self.udp_sender:
+            self.udp_sender.close()
+        if self.spool:
+            self.spool.close()
+    
+    async def _run(self) -> None:
+        """Send queued, retried and spooled data to the endpoint."""
+        while True:
+            try:
+                if not self.connected and not await self._connect():
+                    if self.spool:
+                        # Move queued data to disk while the endpoint is down
+                        batch = self._take_queued()
+                        if batch:
+                            self.spool.append(batch)
+                            self.stats["spooled"] += len(batch)
+                        self.spool.sync()
+                        # Wake for new data as well as for the next attempt, so the queue never overflows
+                        await self._wait_for_data(RETRY_DELAY)
+                    else:
+                        await asyncio.sleep(RETRY_DELAY)
+                    continue
+                
+                spooled = []
+                if self.retry_batch:
+                    # Resend the failed batch before anything newer
+                    batch, self.retry_batch = self._expire(self.retry_batch), []
+                elif self.spool and not self.spool.is_empty():
+                    # Keep delivery order: newer data queues behind the spool
+                    queued = self._take_queued()
+                    if queued:
+                        self.spool.append(queued)
+                        self.stats["spooled"] += len(queued)
+                    spooled = self.spool.read_batch(self.config.batch_max_count, self.config.batch_max_bytes)
+                    batch = self._expire(spooled, count=False)
+                    if spooled and not batch:
+                        # Everything read has expired
+                        self._ack_spool(spooled, batch)
+                        continue
+                else:
+                    # Wake up periodically only when a spool needs its fsync timer
+                    batch = await self._collect_batch(self.config.spool_fsync_interval if self.spool else None)
+                
+                if self.spool:
+                    self.spool.sync()
+                if not batch:
+                    continue
+                
+                if await self._send(batch):
+                    if spooled:
+                        self._ack_spool(spooled, batch)
+                elif spooled:
+                    # Left in the spool, read again after reconnecting
+                    pass
+                elif self.spool:
+                    logging.warning(f"Failed to send {len(batch)} sentences to {self.name}, spooling to disk")
+                    self.spool.append(batch)
+                    self.stats["spooled"] += len(batch)
+                else:
+                    logging.warning(f"Failed to send {len(batch)} sentences to {self.name}, holding for retry")
+                    self.retry_batch = batch
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Unexpected error in sink {self.name}: {e}")
+                await asyncio.sleep(1)
+    
+    async def _run_live_first(self) -> None:
+        """
+        Send live data as soon as it arrives and backfill older data around it.
+        
+        Records older than live_window, batches that failed to send and the
+        spool form the backlog, which is sent whenever the pacer allows.
+        """
+        while True:
+            try:
+                if not self.connected and not await self._connect():
+                    if self.spool:
+                        # Move queued data to disk while the endpoint is down
+                        batch = self._take_queued()
+                        if batch:
+                            self._add_backlog(batch)
+                        self.spool.sync()
+                        # Wake for new data as well as for the next attempt, so the queue never overflows
+                        await self._wait_for_data(RETRY_DELAY)
+                    else:
+                        await asyncio.sleep(RETRY_DELAY)
+                    continue
+                
+                timeout = self.config.spool_fsync_interval if self.spool else None
+                if self._backlog_pending():
+                    timeout = min(self.pacer.delay(), timeout or 1.0)
+                batch = await self._collect_batch(timeout)
+                if batch:
+                    await self._send_live(batch)
+                await self._backfill()
+                if self.spool:
+                    self.spool.sync()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Unexpected error in sink {self.name}: {e}")
+                await asyncio.sleep(1)
+    
+    async def _send_live(self, batch: List[AISRecord]) -> None:
+        """Send the live part of a batch, moving stale and unsent records to the backlog."""
+        live = self._split_live(batch)
+        if live:
+            self._live_done(live, await self._send(live))
+    
+    async def _backfill(self) -> None:
+        """Send one backlog batch if the endpoint is up and the pacer allows it."""
+        backfill = self._next_backfill()
+        if backfill:
+            batch, fresh = backfill
+            self._backfill_done(batch, fresh, not fresh or await self._send(fresh, backlog=True))
+    
+    async def _connect(self) -> bool:
+        """
+        Open the connection, honouring the exponential backoff schedule.
+        
+        Returns:
+            bool: True if connected, False otherwise
+        """
+        if self.udp_sender:
+            return await self._connect_udp()
+        if self.config.protocol == "tcp_server":
+            return await self._listen()
+        
+        now = time.monotonic()
+        if now - self.last_attempt < self.backoff_delay:
+            return False
+        self.last_attempt = now
+        
+        self._close_writer()
+        try:
+            _, self.writer = await asyncio.wait_for(
+                asyncio.open_connection(self.config.ip, self.config.port),
+                SOCKET_TIMEOUT
+            )
+            self.backoff_delay = RECONNECT_DELAY
+            logging.info(f"Connected to {self.config.ip}:{self.config.port}")
+            if self.config.snapshot_on_connect and self.vessel_cache is not None:
+                if self.snapshot_task:
+                    self.snapshot_task.cancel()
+                self.snapshot_task = asyncio.ensure_future(self._send_snapshot(self.writer))
+            return True
+        except (OSError, asyncio.TimeoutError) as e:
+            logging.warning(f"Failed to connect to {self.config.ip}:{self.config.port}: {e}")
+            self.backoff_delay = min(self.backoff_delay * BACKOFF_FACTOR, MAX_BACKOFF_DELAY)
+            return False
+    
+    async def _send(self, batch: List[AISRecord], backlog: bool = False) -> bool:
+        """
+        Render a batch and write it to the endpoint.
+        
+        Args:
+            batch: Records to send, in order
+            backlog: True for backfilled data, which does not count towards latency
+            
+        Returns:
+            bool: True if the batch was written, False otherwise
+        """
+        if await self._write(render_records(batch, self.config.tag_timestamp)):
+            self._sent(batch, backlog)
+            return True
+        return False
+    
+    async def _write(self, buffers: List[bytes]) -> bool:
+        """Write rendered records to the endpoint, returning False on failure."""
+        if self.udp_sender:
+            return self.udp_sender.send_batch(buffers)
+        if self.config.protocol == "tcp_server":
+            self._broadcast(b"".join(buffers))
+            return True
+        
+        try:
+            self.writer.writelines(buffers)
+            # A peer that stops reading must not stall the sink forever
+            await asyncio.wait_for(self.writer.drain(), SOCKET_TIMEOUT)
+            return True
+        except asyncio.TimeoutError:
+            logging.warning(f"Timed out sending data to {self.config.ip}:{self.config.port}")
+            # Closing would wait for the unsent data to flush
+            self.writer.transport.abort()
+            self._close_writer()
+            return False
+        except (OSError, RuntimeError) as e:
+            logging.warning(f"Error sending data to {self.config.ip}:{self.config.port}: {e}")
+            self._close_writer()
+            return False
+    
+    async def _connect_udp(self) -> bool:
+        """
+        Set up the UDP socket, resolving the host without blocking the loop.
+        
+        Returns:
+            bool: True if the socket is ready, False otherwise
+        """
+        if self.udp_sender.connected:
+            return True
+        try:
+            addresses = await asyncio.get_running_loop().getaddrinfo(
+                self.config.ip, self.config.port, family=socket.AF_INET, type=socket.SOCK_DGRAM
+            )
+        except OSError as e:
+            logging.warning(f"Failed to resolve {self.config.ip}: {e}")
+            return False
+        return self.udp_sender.connect(addresses[0][4][0])
+    
+    async def _listen(self) -> bool:
+        """
+        Start listening for clients of a server output.
+        
+        Returns:
+            bool: True if listening, False otherwise
+        """
+        try:
+            self.server = await asyncio.start_server(self._handle_client, self.config.ip, self.config.port)
+            logging.info(f"Serving NMEA to clients on {self.config.ip}:{self.config.port}")
+            return True
+        except OSError as e:
+            logging.error(f"Failed to listen on {self.config.ip}:{self.config.port}: {e}")
+            await asyncio.sleep(RECONNECT_DELAY)
+            return False
+    
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Register a client, discard what it sends and forget it when it disconnects."""
+        peer = writer.get_extra_info("peername")
+        address = f"{peer[0]}:{peer[1]}" if peer else "unknown"
+        self.clients[writer] = address
+        self.client_tasks.add(asyncio.current_task())
+        logging.info(f"Client {address} connected to {self.config.ip}:{self.config.port}")
+        snapshot_task = None
+        if self.config.snapshot_on_connect and self.vessel_cache is not None:
+            snapshot_task = asyncio.ensure_future(self._send_snapshot(writer))
+        try:
+            while await reader.read(RECV_SIZE):
+                pass
+        except OSError:
+            pass
+        finally:
+            if snapshot_task:
+                snapshot_task.cancel()
+            self.clients.pop(writer, None)
+            self.client_tasks.discard(asyncio.current_task())
+            writer.close()
+            logging.info(f"Client {address} disconnected from {self.config.ip}:{self.config.port}")
+    
+    def _broadcast(self, data: bytes) -> None:
+        """
+        Write data to every client without waiting for it to drain.
+        
+        The transport buffers what a client cannot take yet; a client whose
+        buffer exceeds client_buffer bytes has fallen behind and is
+        disconnected.
+        
+        Args:
+            data: Bytes shared by every client
+        """
+        for writer, address in list(self.clients.items()):
+            if writer.transport.get_write_buffer_size() > self.config.client_buffer:
+                logging.warning(f"Client {address} of {self.config.ip}:{self.config.port} fell behind, disconnecting")
+                self.stats["evicted"] += 1
+                del self.clients[writer]
+                writer.transport.abort()
+                continue
+            writer.write(data)
+    
+    async def _send_snapshot(self, writer: asyncio.StreamWriter) -> None:
+        """
+        Write cached records in small chunks, leaving room for live traffic.
+        
+        Chunks are only written while the transport's buffer is below
+        batch_max_bytes; draining is left to the sink task. The records are
+        gathered in the default executor so a large cache does not stall the loop.
+        
+        Args:
+            writer: Endpoint or server client the snapshot is for; a
+                reconnect or disconnect abandons it
+        """
+        records = await asyncio.get_running_loop().run_in_executor(
+            None, self.vessel_cache.records, self.message_filter
+        )
+        chunk_size = int(self.config.snapshot_rate * SNAPSHOT_INTERVAL)
+        start = 0
+        while start < len(records):
+            if (writer is not self.writer and writer not in self.clients) or writer.is_closing():
+                logging.warning(f"Snapshot to {self.name} interrupted")
+                return
+            if writer.transport.get_write_buffer_size() < self.config.batch_max_bytes:
+                chunk = records[start:start + chunk_size]
+                writer.writelines(render_records(chunk, self.config.tag_timestamp))
+                self.stats["snapshot"] += len(chunk)
+                start += chunk_size
+            await asyncio.sleep(SNAPSHOT_INTERVAL)
+        if records:
+            logging.info(f"Sent snapshot of {len(records)} cached sentences to {self.name}")
+    
+    async def _collect_batch(self, timeout: Optional[float]) -> List[AISRecord]:
+        """
+        Take the next data to send from the queue.
+        
+        Without batching this is a single item. With batching, keeps draining
+        until a count or byte limit is hit or batch_max_latency has passed
+        since the first item arrived.
+        
+        Args:
+            timeout: Seconds to wait for the first item, or None to wait indefinitely
+        
+        Returns:
+            List of queued records, empty if nothing arrived in time
+        """
+        record = self.data_queue.get_nowait()
+        if record is None:
+            if not await self._wait_for_data(timeout):
+                return []
+            record = self.data_queue.get_nowait()
+        
+        batch = [record]
+        if not self.config.batch_enabled:
+            return self._expire(batch)
+        
+        loop = asyncio.get_event_loop()
+        size = len(record.data)
+        deadline = loop.time() + self.config.batch_max_latency
+        while len(batch) < self.config.batch_max_count and size < self.config.batch_max_bytes:
+            if self.data_queue.empty():
+                remaining = deadline - loop.time()
+                if remaining <= 0 or not await self._wait_for_data(remaining):
+                    break
+            record = self.data_queue.get_nowait()
+            batch.append(record)
+            size += len(record.data)
+        return self._expire(batch)
+    
+    async def _wait_for_data(self, timeout: Optional[float]) -> bool:
+        """
+        Wait for offer() to queue a record.
+        
+        Args:
+            timeout: Seconds to wait, or None to wait indefinitely
+        
+        Returns:
+            bool: True if a record is queued, False on timeout
+        """
+        self.data_ready.clear()
+        try:
+            await asyncio.wait_for(self.data_ready.wait(), timeout)
+        except asyncio.TimeoutError:
+            return False
+        return not self.data_queue.empty()
+    
+    def _take_queued(self) -> List[AISRecord]:
+        """Remove and return everything currently queued that has not expired."""
+        return self._expire(self.data_queue.take_all())
+    
+    def _close_writer(self) -> None:
+        """Close the TCP connection if open."""
+        if self.writer:
+            try:
+                self.writer.close()
+            except Exception as e:
+                logging.warning(f"Error closing socket: {e}")
+            finally:
+                self.writer = None
+
+
+class DatagramInputProtocol(asyncio.DatagramProtocol):
+    """Feeds datagrams received by the asyncio engine to a UDP input."""
+    
+    def __init__(self, ais_input: InputSource):
+        self.ais_input = ais_input
+    
+    def datagram_received(self, data: bytes, addr: Tuple[str, int]) -> None:
+        self.ais_input.feed_datagram(data, addr)
+
+
+class AsyncAISHandler(AISHandler):
+    """
+    AIS handler running the whole pipeline on one asyncio event loop.
+    
+    Serial ports are read through non-blocking file descriptor readers,
+    network inputs and every output are tasks on the same loop and an optional admin endpoint
+    reports status as JSON, so the thread count no longer grows with the
+    number of outputs.
+    """
+    
+    engine = "asyncio"
+    
+    def __init__(self, config: AISConfig):
+        super().__init__(config)
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.loop_thread = None
+        self.loop_ready = threading.Event()
+        self.stop_event: Optional[asyncio.Event] = None
+        self.serial_fds: Dict[str, int] = {}
+        self.input_tasks: List[asyncio.Task] = []
+    
+    def _create_sinks(self) -> list:
+        """Create one asyncio sink per configured output."""
+        return [AsyncOutputSink(output, self.vessel_cache) for output in self.config.outputs]
+    
+    def _run_loop(self) -> None:
+        """Run the event loop until stop() is called."""
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self._main())
+        except Exception as e:
+            logging.error(f"Unexpected error in event loop: {e}")
+    
+    async def _main(self) -> None:
+        """Start the sinks, serial readers and admin endpoint, then wait for stop."""
+        self.stop_event = asyncio.Event()
+        self.started_at = time.time()
+        self.loop_ready.set()
+        
+        for sink in self.sinks:
+            sink.start()
+        
+        admin_server = None
+        if self.config.admin_port:
+            admin_server = await asyncio.start_server(
+                self._handle_admin, self.config.admin_host, self.config.admin_port
+            )
+            logging.info(f"Admin endpoint listening on {self.config.admin_host}:{self.config.admin_port}")
+        
+        for ais_input in self.inputs:
+            if isinstance(ais_input, SerialInput):
+                self._open_serial(ais_input)
+            else:
+                self.input_tasks.append(asyncio.ensure_future(self._run_network_input(ais_input)))
+        await self.stop_event.wait()
+        
+        for ais_input in self.inputs:
+            if isinstance(ais_input, SerialInput):
+                self._reset_serial(ais_input, reconnect=False)
+        for task in self.input_tasks:
+            task.cancel()
+        await asyncio.gather(*self.input_tasks, return_exceptions=True)
+        for sink in self.sinks:
+            await sink.stop()
+        if admin_server:
+            admin_server.close()
+            await admin_server.wait_closed()
+    
+    def _open_serial(self, ais_input: SerialInput) -> None:
+        """Open a serial port and register it with the event loop."""
+        if not self.running:
+            return
+        ais_input.connect()
+        if ais_input.serial_port is None:
+            self.loop.call_later(RECONNECT_DELAY, self._open_serial, ais_input)
+            return
+        
+        # Non-blocking reads: return whatever is available
+        ais_input.serial_port.timeout = 0
+        fd = ais_input.serial_port.fileno()
+        self.serial_fds[ais_input.config.name] = fd
+        self.loop.add_reader(fd, self._on_serial_readable, ais_input)
+    
+    def _reset_serial(self, ais_input: SerialInput, reconnect: bool = True) -> None:
+        """Unregister and close a serial port, optionally scheduling a reconnect."""
+        fd = self.serial_fds.pop(ais_input.config.name, None)
+        if fd is not None:
+            self.loop.remove_reader(fd)
+        ais_input.close()
+        if reconnect:
+            self.loop.call_later(RECONNECT_DELAY, self._open_serial, ais_input)
+    
+    def _on_serial_readable(self, ais_input: SerialInput) -> None:
+        """Read available serial data and dispatch every complete line."""
+        try:
+            ais_input.read()
+        except serial.SerialException as e:
+            logging.error(f"AIS serial read error on {ais_input.config.serial_port}: {e}")
+            self._reset_serial(ais_input)
+    
+    async def _run_network_input(self, ais_input: InputSource) -> None:
+        """Run a network input on the loop until cancelled."""
+        if isinstance(ais_input, TCPClientInput):
+            await self._run_tcp_client(ais_input)
+            return
+        
+        while True:
+            try:
+                sock = ais_input.open_socket()
+            except (OSError, ValueError) as e:
+                logging.error(f"Failed to listen on {ais_input.description}: {e}")
+                await asyncio.sleep(RECONNECT_DELAY)
+                continue
+            
+            clients: Dict[asyncio.Task, asyncio.StreamWriter] = {}
+            if isinstance(ais_input, TCPServerInput):
+                server = await asyncio.start_server(
+                    functools.partial(self._read_input_client, ais_input, clients), sock=sock
+                )
+            else:
+                server, _ = await self.loop.create_datagram_endpoint(
+                    lambda: DatagramInputProtocol(ais_input), sock=sock
+                )
+            logging.info(f"Listening for NMEA on {ais_input.description}")
+            
+            try:
+                # Serve until the handler stops
+                await asyncio.Future()
+            finally:
+                server.close()
+                # Closing the connections ends the client reads
+                tasks = list(clients)
+                for writer in clients.values():
+                    writer.close()
+                await asyncio.gather(*tasks, return_exceptions=True)
+    
+    async def _run_tcp_client(self, ais_input: TCPClientInput) -> None:
+        """Connect to a remote NMEA server and read until cancelled."""
+        backoff_delay = RECONNECT_DELAY
+        while True:
+            try:
+                reader, writer = await asyncio.wait_for(
+                    asyncio.open_connection(ais_input.config.host, ais_input.config.port),
+                    SOCKET_TIMEOUT
+                )
+            except (OSError, asyncio.TimeoutError) as e:
+                logging.warning(f"Failed to connect to input {ais_input.description}: {e}")
+                await asyncio.sleep(backoff_delay)
+                backoff_delay = min(backoff_delay * BACKOFF_FACTOR, MAX_BACKOFF_DELAY)
+                continue
+            
+            backoff_delay = RECONNECT_DELAY
+            logging.info(f"Connected to input {ais_input.description}")
+            try:
+                while True:
+                    data = await reader.read(RECV_SIZE)
+                    if not data:
+                        logging.warning(f"Input {ais_input.description} closed the connection")
+                        break
+                    ais_input.feed(data)
+            except OSError as e:
+                logging.warning(f"Error reading from input {ais_input.description}: {e}")
+            finally:
+                writer.close()
+                ais_input.reset()
+    
+    async def _read_input_client(self, ais_input: TCPServerInput,
+                                 clients: Dict[asyncio.Task, asyncio.StreamWriter],
+                                 reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Read NMEA pushed by one client of a TCP server input."""
+        task = asyncio.current_task()
+        clients[task] = writer
+        address = writer.get_extra_info("peername")
+        logging.info(f"Input {ais_input.config.name}: client {address[0]}:{address[1]} connected")
+        splitter = LineSplitter()
+        assembler = ais_input.new_assembler()
+        try:
+            while True:
+                data = await reader.read(RECV_SIZE)
+                if not data:
+                    break
+                ais_input.feed(data, splitter, assembler)
+        except OSError as e:
+            logging.warning(f"Input {ais_input.config.name}: error reading from {address[0]}:{address[1]}: {e}")
+        finally:
+            writer.close()
+            if assembler:
+                assembler.clear()
+            clients.pop(task, None)
+            logging.info(f"Input {ais_input.config.name}: client {address[0]}:{address[1]} disconnected")
+    
+    async def _handle_admin(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Write a JSON status snapshot to an admin client and close."""
+        try:
+            writer.write(json.dumps(self.status()).encode() + b"\n")
+            await writer.drain()
+        except OSError as e:
+            logging.warning(f"Error writing admin status: {e}")
+        finally:
+            writer.close()
+    
+    def start(self) -> None:
+        """Start the event loop thread."""
+        if self.running:
+            return
+        
+        self.running = True
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = threading.Thread(
+            target=self._run_loop,
+            name="AIS-Loop",
+            daemon=True
+        )
+        self.loop_thread.start()
+        
+        logging.info("AIS handler started (asyncio engine)")
+    
+    def stop(self) -> None:
+        """Stop the event loop and close all connections."""
+        if not self.running:
+            return
+        
+        logging.info("Stopping AIS handler...")
+        self.running = False
+        
+        if self.loop_ready.wait(timeout=5):
+            self.loop.call_soon_threadsafe(self.stop_event.set)
+        if self.loop_thread and self.loop_thread.is_alive():
+            self.loop_thread.join(timeout=10)
+        if not self.loop.is_running():
+            self.loop.close()
         
         logging.info("AIS handler stopped")
 
@@ -389,10 +4174,13 @@ class Application:
             # Setup logging
             setup_logging(config)
             
-            logging.info(f"Starting AIS forwarding from {config.serial_port} to {config.ip}:{config.port}")
+            sources = ", ".join(ais_input.serial_port or f"{ais_input.host}:{ais_input.port}" for ais_input in config.inputs)
+            destinations = ", ".join(f"{output.ip}:{output.port}" for output in config.outputs)
+            logging.info(f"Starting AIS forwarding from {sources} to {destinations}")
             
             # Create and start AIS handler
-            self.ais_handler = AISHandler(config)
+            handler_class = AsyncAISHandler if config.engine == "asyncio" else AISHandler
+            self.ais_handler = handler_class(config)
             self.ais_handler.start()
             
             self.running = True
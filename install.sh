@@ -34,10 +34,11 @@ apt-get install -y python3 python3-pip python3-venv
 echo "Creating project directories..."
 mkdir -p /home/JLBMaritime/ais-forwarder/config
 mkdir -p /home/JLBMaritime/ais-forwarder/logs
+mkdir -p /home/JLBMaritime/ais-forwarder/spool
 
 # Copy files
 echo "Copying project files..."
-cp ais_forwarder.py /home/JLBMaritime/ais-forwarder/
+cp ais_forwarder.py ais_decoder.py /home/JLBMaritime/ais-forwarder/
 cp ais_config.conf /home/JLBMaritime/ais-forwarder/config/
 
 # Create virtual environment and install requirements